@@ -4,21 +4,93 @@ from jose import JWTError, jwt
 from passlib.context import CryptContext
 import os
 import hmac
+import base64
 import hashlib
+import threading
+import time
+from collections import OrderedDict
 
 # Configuración
 SECRET_KEY = os.getenv("SECRET_KEY")
 ALGORITHM = os.getenv("ALGORITHM")
 ACCESS_TOKEN_EXPIRE_MINUTES = int(os.getenv("ACCESS_TOKEN_EXPIRE_MINUTES"))
 
-pwd_context = CryptContext(schemes=["pbkdf2_sha256"], deprecated="auto")
+# Iteraciones de PBKDF2. Si se cambia, los hashes con otro valor se recalculan
+# en el siguiente login correcto (verify_and_update).
+PASSWORD_ROUNDS = int(os.getenv("PASSWORD_ROUNDS", "29000"))
+pwd_context = CryptContext(
+    schemes=["pbkdf2_sha256"],
+    deprecated="auto",
+    pbkdf2_sha256__rounds=PASSWORD_ROUNDS,
+    pbkdf2_sha256__min_rounds=PASSWORD_ROUNDS,
+    pbkdf2_sha256__max_rounds=PASSWORD_ROUNDS,
+)
+
+# Intentos de login fallidos por usuario antes de bloquearlo un tiempo
+# El bloqueo fuerte es por (IP, usuario): un atacante no puede dejar sin acceso
+# a otro usuario desde su propia IP. Por usuario (desde cualquier IP) hay un
+# límite más alto, para frenar ataques repartidos entre muchas IPs.
+LOGIN_MAX_ATTEMPTS = int(os.getenv("LOGIN_MAX_ATTEMPTS", "5"))
+LOGIN_USER_MAX_ATTEMPTS = int(os.getenv("LOGIN_USER_MAX_ATTEMPTS", "20"))
+LOGIN_LOCK_SECONDS = int(os.getenv("LOGIN_LOCK_MINUTES", "5")) * 60
+LOGIN_TRACKED_MAX = 10000   # Claves recordadas como máximo (las más antiguas se descartan)
+_login_failures = OrderedDict()   # clave -> (fallos, bloqueado_hasta, último_fallo)
+_login_lock = threading.Lock()
 
 def verify_password(plain_password, hashed_password):
     return pwd_context.verify(plain_password, hashed_password)
 
+def verify_and_update(plain_password, hashed_password):
+    """Verifica la contraseña y devuelve (válida, hash_nuevo o None si no hay que actualizar)."""
+    return pwd_context.verify_and_update(plain_password, hashed_password)
+
+def dummy_verify():
+    """Mismo costo que una verificación real: el usuario inexistente no responde más rápido."""
+    pwd_context.dummy_verify()
+
 def get_password_hash(password):
     return pwd_context.hash(password)
 
+def _login_keys(ip: str, username: str):
+    """(clave, máximo de intentos) que cuentan para un intento de login."""
+    return (
+        (("ip", ip, username), LOGIN_MAX_ATTEMPTS),
+        (("user", username), LOGIN_USER_MAX_ATTEMPTS),
+    )
+
+def _prune_login_failures(now: float):
+    # El orden es el del último fallo: los vencidos quedan al principio
+    while _login_failures:
+        key, (_, locked_until, last_failure) = next(iter(_login_failures.items()))
+        if max(locked_until, last_failure + LOGIN_LOCK_SECONDS) > now and len(_login_failures) <= LOGIN_TRACKED_MAX:
+            break
+        del _login_failures[key]
+
+def login_locked_for(ip: str, username: str) -> int:
+    """Segundos que le quedan de bloqueo a ese usuario desde esa IP (0 = puede intentar)."""
+    now = time.monotonic()
+    with _login_lock:
+        locked_until = max(_login_failures.get(key, (0, 0.0, 0.0))[1] for key, _ in _login_keys(ip, username))
+    return max(0, int(locked_until - now))
+
+def record_login_failure(ip: str, username: str):
+    now = time.monotonic()
+    with _login_lock:
+        for key, max_attempts in _login_keys(ip, username):
+            failures, locked_until, last_failure = _login_failures.pop(key, (0, 0.0, 0.0))
+            if (locked_until and locked_until <= now) or last_failure + LOGIN_LOCK_SECONDS <= now:
+                failures = 0   # El bloqueo anterior o los fallos viejos ya vencieron: se empieza de nuevo
+            failures += 1
+            if failures >= max_attempts:
+                locked_until = now + LOGIN_LOCK_SECONDS
+            _login_failures[key] = (failures, locked_until, now)
+        _prune_login_failures(now)
+
+def reset_login_failures(ip: str, username: str):
+    with _login_lock:
+        for key, _ in _login_keys(ip, username):
+            _login_failures.pop(key, None)
+
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     to_encode = data.copy()
     if expires_delta:
@@ -30,45 +102,83 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
+# Formato compacto: "1" + llave + ID + firma base32 (13 caracteres).
+# Todo en mayúsculas/dígitos para que el QR use el modo alfanumérico (más denso).
+QR_FORMAT = "1"
+QR_SIG_LENGTH = 13          # 8 bytes de HMAC en base32 (64 bits, igual que el formato anterior)
+QR_ALPHANUMERIC = set("0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZ$%*+-./:")
+# Identificadores de llave válidos: 1 letra o dígito, salvo el dígito del formato
+QR_KEY_IDS = set("0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZ") - {QR_FORMAT}
+
 # Leer el secreto nuevo
 QR_SECRET_KEY = os.getenv("QR_SECRET_KEY", "secreto_por_defecto_inseguro")
+# Identificador de la llave actual (1 carácter A-Z/0-9). Para rotar el secreto se
+# cambia QR_SECRET_KEY y QR_KEY_ID, y la llave anterior pasa a QR_PREVIOUS_KEYS
+# ("A=secreto_viejo,B=otro") para que los carnets ya impresos sigan funcionando.
+QR_KEY_ID = (os.getenv("QR_KEY_ID") or "A").strip().upper()
+QR_PREVIOUS_KEYS = {
+    key.strip().upper(): secret
+    for key, secret in (item.split("=", 1) for item in os.getenv("QR_PREVIOUS_KEYS", "").split(",") if "=" in item)
+}
+# Un ID inválido firmaría QR que no se pueden verificar (o que caen fuera del modo
+# alfanumérico): mejor no arrancar
+for _key_id in [QR_KEY_ID, *QR_PREVIOUS_KEYS]:
+    if len(_key_id) != 1 or _key_id not in QR_KEY_IDS:
+        raise RuntimeError(
+            f"Identificador de llave QR inválido: {_key_id!r} (debe ser 1 letra A-Z o dígito, distinto de {QR_FORMAT})"
+        )
+QR_KEYS = {**QR_PREVIOUS_KEYS, QR_KEY_ID: QR_SECRET_KEY}
+
+def _compact_signature(secret: str, message: str) -> str:
+    digest = hmac.new(bytes(secret, 'utf-8'), bytes(message, 'utf-8'), hashlib.sha256).digest()
+    return base64.b32encode(digest[:8]).decode("ascii").rstrip("=")
+
+def _legacy_signature(secret: str, student_id: str) -> str:
+    return hmac.new(bytes(secret, 'utf-8'), bytes(student_id, 'utf-8'), hashlib.sha256).hexdigest()[:16]
 
 def sign_qr_content(student_id: str) -> str:
     """
-    Genera un string firmado: ID.FIRMA
-    Ejemplo: 2023001.f8a9...
+    Genera el contenido firmado del QR.
+    Ejemplo: 1A2023001KZXW6YTBOI3DE (formato, llave, ID, firma)
+    Si el ID tiene caracteres fuera del modo alfanumérico se usa el formato
+    anterior: ID.FIRMA (hex).
     """
-    # Convertir a bytes
-    key = bytes(QR_SECRET_KEY, 'utf-8')
-    msg = bytes(student_id, 'utf-8')
-    
-    # Crear firma HMAC SHA256
-    signature = hmac.new(key, msg, hashlib.sha256).hexdigest()
-    
-    # Retornar formato combinado (usamos punto como separador)
-    return f"{student_id}.{signature[:16]}" # Usamos los primeros 16 caracteres del hash para que el QR no sea gigante
+    if not student_id or not set(student_id) <= QR_ALPHANUMERIC:
+        return f"{student_id}.{_legacy_signature(QR_SECRET_KEY, student_id)}"
+
+    message = f"{QR_FORMAT}{QR_KEY_ID}{student_id}"
+    return message + _compact_signature(QR_SECRET_KEY, message)
+
+def _verify_compact(qr_content: str) -> Optional[str]:
+    if not qr_content.startswith(QR_FORMAT) or len(qr_content) <= 2 + QR_SIG_LENGTH:
+        return None
+    secret = QR_KEYS.get(qr_content[1])
+    if secret is None:
+        return None
+    message, received_sig = qr_content[:-QR_SIG_LENGTH], qr_content[-QR_SIG_LENGTH:]
+    # Comparación segura contra ataques de tiempo
+    if hmac.compare_digest(_compact_signature(secret, message), received_sig):
+        return message[2:]
+    return None
+
+def _verify_legacy(qr_content: str) -> Optional[str]:
+    if "." not in qr_content:
+        return None # Formato inválido (probablemente un QR viejo o falso)
+    student_id, received_sig = qr_content.split(".", 1)
+    # El formato anterior no indica la llave: se prueban todas las conocidas
+    for secret in QR_KEYS.values():
+        if hmac.compare_digest(_legacy_signature(secret, student_id), received_sig):
+            return student_id
+    return None
 
 def verify_qr_content(qr_content: str) -> str:
     """
     Verifica la firma. Si es válida, retorna el student_id limpio.
     Si es inválida, retorna None.
+    Acepta el formato compacto y el anterior (ID.FIRMA) de carnets ya impresos.
     """
     try:
-        if "." not in qr_content:
-            return None # Formato inválido (probablemente un QR viejo o falso)
-            
-        student_id, received_sig = qr_content.split(".", 1)
-        
-        # Recalcular firma real
-        key = bytes(QR_SECRET_KEY, 'utf-8')
-        msg = bytes(student_id, 'utf-8')
-        expected_full_sig = hmac.new(key, msg, hashlib.sha256).hexdigest()
-        expected_sig = expected_full_sig[:16]
-        
-        # Comparación segura contra ataques de tiempo
-        if hmac.compare_digest(expected_sig, received_sig):
-            return student_id
-        else:
-            return None
+        qr_content = qr_content.strip()
+        return _verify_compact(qr_content) or _verify_legacy(qr_content)
     except Exception:
-        return None
\ No newline at end of file
+        return None
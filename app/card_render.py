@@ -0,0 +1,412 @@
+"""
+Motor de carnets en PDF (reportlab).
+Separado del router para que los procesos del pool de render lo importen
+sin cargar FastAPI ni la base de datos.
+"""
+from reportlab.lib.units import mm
+from reportlab.lib.pagesizes import A4, letter
+from types import SimpleNamespace
+from typing import TYPE_CHECKING
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import multiprocessing
+import tempfile
+import hashlib
+import io
+import os
+import math
+from . import qr, photos, lanes
+
+# El canvas y las fuentes de reportlab se importan al dibujar: el router de
+# carnets se carga en todos los workers, aunque no generen ningún PDF.
+if TYPE_CHECKING:
+    from reportlab.pdfgen import canvas
+
+# --- CONFIGURACIÓN ---
+CARD_WIDTH = 54 * mm
+CARD_HEIGHT = 85 * mm
+ASSETS_DIR = "app/static/assets"
+BG_PATH = os.path.join(ASSETS_DIR, "carnet_bg.png")
+AVATAR_PATH = os.path.join(ASSETS_DIR, "avatar.png")
+BACK_PATH = os.path.join(ASSETS_DIR, "carnet_back.png")   # Reverso (opcional, impresión dúplex)
+TEXT_MARGIN = 4 * mm
+MAX_TEXT_WIDTH = CARD_WIDTH - (2 * TEXT_MARGIN)
+PHOTO_SIZE = 30 * mm
+PHOTO_X = (CARD_WIDTH - PHOTO_SIZE) / 2
+PHOTO_Y = 43 * mm
+CHUNK_SIZE = int(os.getenv("CARD_CHUNK_SIZE", "100"))   # Carnets por proceso
+CARD_WORKERS = int(os.getenv("CARD_WORKERS", "0")) or lanes.BULK_PROCESSES
+CARD_QR_FORMAT = os.getenv("CARD_QR_FORMAT", "vector").lower()   # vector / png
+# Impresión en pliegos (varios carnets por hoja)
+SHEET_SIZES = {"A4": A4, "LETTER": letter}
+SHEET_MARGIN = 10 * mm      # Espacio para las marcas de corte
+SHEET_GAP = 2 * mm          # Separación entre carnets
+CROP_MARK = 4 * mm          # Largo de las marcas de corte
+
+# --- UTILIDADES ---
+
+def draw_qr_vector(c: "canvas.Canvas", data: str, x: float, y: float, size: float):
+    """QR como rectángulos vectoriales (nítido a cualquier escala, sin imagen)."""
+    matrix = qr.qr_matrix(data)
+    module = size / len(matrix)
+    top = y + size
+    path = c.beginPath()
+    for row, col, length in qr.dark_runs(matrix):
+        path.rect(x + col * module, top - (row + 1) * module, length * module, module)
+    c.saveState()
+    # Fondo blanco, igual que la imagen PNG, para no perder contraste sobre el diseño
+    c.setFillColorRGB(1, 1, 1)
+    c.rect(x, y, size, size, stroke=0, fill=1)
+    c.setFillColorRGB(0, 0, 0)
+    c.drawPath(path, stroke=0, fill=1)
+    c.restoreState()
+
+def _sign(qr_data: str) -> str:
+    from . import auth
+    return auth.sign_qr_content(qr_data)
+
+def card_fingerprint(key: str, full_name: str, photo_file: str) -> str:
+    """
+    Hash de lo que se imprime en el carnet (ID, nombre, foto con su fecha de
+    modificación y la llave con que se firma el QR). Si no cambia, no hay que reimprimir:
+    al rotar QR_KEY_ID todos los carnets cuentan como cambiados.
+    """
+    from . import auth
+    photo_mtime = ""
+    if photo_file:
+        try:
+            photo_mtime = int(os.path.getmtime(photo_file))
+        except OSError:
+            pass
+    raw = f"{key}|{full_name}|{photo_file or ''}|{photo_mtime}|{auth.QR_KEY_ID}"
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+def card_snapshot(person, is_employee=False):
+    """
+    Copia liviana (serializable) de los datos impresos en el carnet,
+    con el QR ya firmado, para enviarla a otro proceso.
+    """
+    key = person.doc_id if is_employee else person.student_id
+    data = SimpleNamespace(
+        full_name=person.full_name,
+        photo_path=person.photo_path,
+        # Ruta en disco ya resuelta: los procesos no repiten os.path.exists
+        photo_file=photos.resolve_photo_path(person.photo_path),
+    )
+    if is_employee:
+        data.doc_id = key
+    else:
+        data.student_id = key
+    return {
+        "id": person.id,
+        "key": key,
+        "person": data,
+        "is_employee": is_employee,
+        "qr_payload": _sign(key),
+        "fingerprint": card_fingerprint(key, person.full_name, data.photo_file),
+    }
+
+def split_text_balanced(text):
+    words = text.split()
+    if len(words) <= 1: return text, ""
+    mid = math.ceil(len(words) / 2)
+    return " ".join(words[:mid]), " ".join(words[mid:])
+
+class CardTemplate:
+    """
+    Recursos comunes de los carnets de un mismo PDF.
+    El fondo y el avatar genérico se guardan una sola vez como Form XObject
+    y cada carnet solo los referencia (doForm), en vez de volver a leer y
+    dibujar la imagen en cada página.
+    """
+
+    def __init__(self, c: "canvas.Canvas"):
+        self.c = c
+        self.has_background = os.path.exists(BG_PATH)
+        self.has_avatar = os.path.exists(AVATAR_PATH)
+        if self.has_background:
+            c.beginForm("card_bg")
+            c.drawImage(BG_PATH, 0, 0, width=CARD_WIDTH, height=CARD_HEIGHT)
+            c.endForm()
+        if self.has_avatar:
+            c.beginForm("card_avatar")
+            c.drawImage(AVATAR_PATH, PHOTO_X, PHOTO_Y, width=PHOTO_SIZE, height=PHOTO_SIZE, mask=None)
+            c.endForm()
+
+    def draw_background(self):
+        if self.has_background:
+            self.c.doForm("card_bg")
+        else:
+            self.c.setFillColorRGB(1, 1, 1)
+            self.c.rect(0, 0, CARD_WIDTH, CARD_HEIGHT, fill=1, stroke=1)
+
+    def draw_avatar(self) -> bool:
+        if self.has_avatar:
+            self.c.doForm("card_avatar")
+        return self.has_avatar
+
+def _photo_file(person):
+    # Los snapshots traen la ruta resuelta; los modelos se resuelven aquí
+    if hasattr(person, "photo_file"):
+        return person.photo_file
+    return photos.resolve_photo_path(person.photo_path)
+
+def draw_card(c: "canvas.Canvas", person, is_employee=False, qr_payload: str = None,
+              template: CardTemplate = None):
+    """
+    Dibuja un carnet genérico.
+    person: puede ser modelo Student o Employee (o su copia con card_snapshot)
+    qr_payload: contenido firmado del QR; si no se entrega se firma aquí
+    template: recursos compartidos del PDF; en lotes se crea uno por canvas
+    """
+    from reportlab.lib.utils import ImageReader
+    from reportlab.pdfbase.pdfmetrics import stringWidth
+
+    if template is None:
+        template = CardTemplate(c)
+
+    # 1. Fondo
+    template.draw_background()
+
+    # 2. Foto (Circular)
+    photo_size = PHOTO_SIZE
+    photo_x = PHOTO_X
+    photo_y = PHOTO_Y
+    radius = photo_size / 2
+
+    c.saveState()
+    path = c.beginPath()
+    path.circle(photo_x + radius, photo_y + radius, radius) 
+    c.clipPath(path, stroke=0, fill=0)
+
+    # Foto personal; si no hay, avatar genérico; si tampoco, gris
+    drawn = False
+    image_to_draw = _photo_file(person)
+    if image_to_draw:
+        # Recortada y reducida a la resolución de impresión (desde la caché)
+        image_to_draw = photos.print_photo(image_to_draw, photo_size)
+        try:
+            c.drawImage(image_to_draw, photo_x, photo_y, width=photo_size, height=photo_size, mask=None) 
+            drawn = True
+        except Exception:
+            pass
+    if not drawn and not template.draw_avatar():
+        c.setFillColorRGB(0.9, 0.9, 0.9)
+        c.rect(photo_x, photo_y, photo_size, photo_size, fill=1)
+    c.restoreState()
+    
+    # Borde foto
+    c.setStrokeColorRGB(0.2, 0.2, 0.2)
+    c.setLineWidth(0.5)
+    c.circle(photo_x + radius, photo_y + radius, radius, stroke=1, fill=0)
+
+    # 3. Nombre
+    c.setFillColorRGB(0, 0, 0)
+    name_y = 36 * mm
+    full_name = person.full_name.upper()
+    font_name = "Helvetica-Bold"
+    font_size = 12
+    
+    if stringWidth(full_name, font_name, font_size) > MAX_TEXT_WIDTH:
+        font_size = 10
+        if stringWidth(full_name, font_name, font_size) > MAX_TEXT_WIDTH:
+            l1, l2 = split_text_balanced(full_name)
+            c.setFont(font_name, 11)
+            c.drawCentredString(CARD_WIDTH/2, name_y + 2*mm, l1)
+            c.drawCentredString(CARD_WIDTH/2, name_y - 2*mm, l2)
+        else:
+            c.setFont(font_name, font_size)
+            c.drawCentredString(CARD_WIDTH/2, name_y, full_name)
+    else:
+        c.setFont(font_name, font_size)
+        c.drawCentredString(CARD_WIDTH/2, name_y, full_name)
+
+    # 4. Datos Variables (Estudiante vs Empleado)
+    c.setFont("Helvetica", 10)
+    info_y = 30 * mm
+    
+    if is_employee:
+        # EMPLEADO
+        #if person.position:
+        #    c.drawCentredString(CARD_WIDTH/2, info_y + 4*mm, person.position.upper())
+        c.setFont("Helvetica", 9)
+        c.drawCentredString(CARD_WIDTH/2, info_y, f"C.C.: {person.doc_id}")
+        qr_data = person.doc_id
+    else:
+        # ESTUDIANTE
+        # Curso omitido según diseño anterior, o se puede poner si se desea
+        # c.drawCentredString(CARD_WIDTH/2, info_y + 4*mm, person.course) 
+        c.setFont("Helvetica", 9)
+        c.drawCentredString(CARD_WIDTH/2, info_y, f"ID: {person.student_id}")
+        qr_data = person.student_id
+
+    # 5. QR Firmado (vectorial, o PNG desde la caché)
+    secure_qr = qr_payload or _sign(qr_data)
+    
+    qr_size = 26 * mm
+    qr_x = (CARD_WIDTH - qr_size) / 2
+    
+    if CARD_QR_FORMAT == "png":
+        c.drawImage(ImageReader(io.BytesIO(qr.qr_png(secure_qr))), qr_x, 3*mm, width=qr_size, height=qr_size)
+    else:
+        draw_qr_vector(c, secure_qr, qr_x, 3*mm, qr_size)
+
+# --- PLIEGOS ---
+
+def sheet_layout(sheet: str = "A4", cols: int = None, rows: int = None, duplex: bool = False):
+    """
+    Distribución de carnets en una hoja. Si no se indican columnas/filas se
+    usan las que caben. Retorna un dict (serializable para el pool) o lanza
+    ValueError si la grilla no cabe en la hoja.
+    """
+    page_width, page_height = SHEET_SIZES[sheet.upper()]
+    max_cols = int((page_width - 2 * SHEET_MARGIN + SHEET_GAP) // (CARD_WIDTH + SHEET_GAP))
+    max_rows = int((page_height - 2 * SHEET_MARGIN + SHEET_GAP) // (CARD_HEIGHT + SHEET_GAP))
+    cols = cols or max_cols
+    rows = rows or max_rows
+    if cols < 1 or rows < 1 or cols > max_cols or rows > max_rows:
+        raise ValueError(f"En {sheet.upper()} caben máximo {max_cols} x {max_rows} carnets")
+
+    grid_width = cols * CARD_WIDTH + (cols - 1) * SHEET_GAP
+    grid_height = rows * CARD_HEIGHT + (rows - 1) * SHEET_GAP
+    return {
+        "page_size": (page_width, page_height),
+        "cols": cols,
+        "rows": rows,
+        "duplex": duplex,
+        # Grilla centrada: así el reverso espejado cae sobre el frente
+        "x0": (page_width - grid_width) / 2,
+        "y0": (page_height - grid_height) / 2,
+    }
+
+def _slot_origin(layout, index: int, mirrored: bool = False):
+    """Esquina inferior izquierda del carnet `index` (de arriba a abajo, izquierda a derecha)."""
+    row, col = divmod(index, layout["cols"])
+    if mirrored:
+        # Reverso con volteo por el borde largo: las columnas se invierten
+        col = layout["cols"] - 1 - col
+    x = layout["x0"] + col * (CARD_WIDTH + SHEET_GAP)
+    y = layout["y0"] + (layout["rows"] - 1 - row) * (CARD_HEIGHT + SHEET_GAP)
+    return x, y
+
+def _draw_crop_marks(c: "canvas.Canvas", layout):
+    """Marcas de corte en el margen, alineadas con cada borde de carnet."""
+    page_width, page_height = layout["page_size"]
+    x0, y0 = layout["x0"], layout["y0"]
+    x_edges, y_edges = set(), set()
+    for col in range(layout["cols"]):
+        x = x0 + col * (CARD_WIDTH + SHEET_GAP)
+        x_edges.update((x, x + CARD_WIDTH))
+    for row in range(layout["rows"]):
+        y = y0 + row * (CARD_HEIGHT + SHEET_GAP)
+        y_edges.update((y, y + CARD_HEIGHT))
+    top, right = page_height - y0, page_width - x0
+
+    c.saveState()
+    c.setStrokeColorRGB(0, 0, 0)
+    c.setLineWidth(0.25)
+    for x in x_edges:
+        c.line(x, y0 - 1 * mm, x, y0 - 1 * mm - CROP_MARK)
+        c.line(x, top + 1 * mm, x, top + 1 * mm + CROP_MARK)
+    for y in y_edges:
+        c.line(x0 - 1 * mm, y, x0 - 1 * mm - CROP_MARK, y)
+        c.line(right + 1 * mm, y, right + 1 * mm + CROP_MARK, y)
+    c.restoreState()
+
+def _draw_back(c: "canvas.Canvas", has_back: bool):
+    if has_back:
+        c.doForm("card_back")
+    else:
+        c.setStrokeColorRGB(0.8, 0.8, 0.8)
+        c.rect(0, 0, CARD_WIDTH, CARD_HEIGHT, fill=0, stroke=1)
+
+def _render_sheets(c: "canvas.Canvas", cards, layout):
+    template = CardTemplate(c)
+    has_back = layout["duplex"] and os.path.exists(BACK_PATH)
+    if has_back:
+        c.beginForm("card_back")
+        c.drawImage(BACK_PATH, 0, 0, width=CARD_WIDTH, height=CARD_HEIGHT)
+        c.endForm()
+
+    per_sheet = layout["cols"] * layout["rows"]
+    for start in range(0, len(cards), per_sheet):
+        sheet_cards = cards[start:start + per_sheet]
+        # Frente: el mismo draw_card, desplazado a su casilla
+        for index, card in enumerate(sheet_cards):
+            c.saveState()
+            c.translate(*_slot_origin(layout, index))
+            draw_card(c, card["person"], card["is_employee"], card["qr_payload"], template)
+            c.restoreState()
+        _draw_crop_marks(c, layout)
+        c.showPage()
+
+        if layout["duplex"]:
+            for index in range(len(sheet_cards)):
+                c.saveState()
+                c.translate(*_slot_origin(layout, index, mirrored=True))
+                _draw_back(c, has_back)
+                c.restoreState()
+            _draw_crop_marks(c, layout)
+            c.showPage()
+
+# --- LOTES ---
+
+def render_chunk(cards, out_path: str, layout: dict = None):
+    """
+    Dibuja una lista de carnets (snapshots) en un PDF. Se ejecuta en el pool.
+    layout: distribución en pliegos (sheet_layout); sin él, un carnet por página.
+    """
+    from reportlab.pdfgen import canvas
+
+    if layout:
+        c = canvas.Canvas(out_path, pagesize=layout["page_size"])
+        _render_sheets(c, cards, layout)
+        c.save()
+        return len(cards)
+
+    c = canvas.Canvas(out_path, pagesize=(CARD_WIDTH, CARD_HEIGHT))
+    template = CardTemplate(c)
+    for card in cards:
+        draw_card(c, card["person"], card["is_employee"], card["qr_payload"], template)
+        c.showPage()
+    c.save()
+    return len(cards)
+
+def merge_pdfs(paths, out_path: str):
+    from pypdf import PdfWriter
+    writer = PdfWriter()
+    for path in paths:
+        writer.append(path)
+    # Cada bloque trae su propia copia del fondo y el avatar: dejar una sola
+    writer.compress_identical_objects(remove_identicals=True, remove_orphans=True)
+    with open(out_path, "wb") as f:
+        writer.write(f)
+
+def render_batch(cards, out_path: str, progress=None, layout: dict = None):
+    """
+    Genera un PDF con muchos carnets: se divide en bloques que se dibujan
+    en paralelo (procesos) y luego se unen en un solo archivo.
+    progress: callback opcional progress(cantidad) al terminar cada bloque.
+    layout: distribución en pliegos (sheet_layout), opcional.
+    """
+    chunk_size = CHUNK_SIZE
+    if layout:
+        # Bloques de hojas completas, para no dejar hojas a medias entre bloques
+        per_sheet = layout["cols"] * layout["rows"]
+        chunk_size = max(1, math.ceil(CHUNK_SIZE / per_sheet)) * per_sheet
+    chunks = [cards[i:i + chunk_size] for i in range(0, len(cards), chunk_size)]
+    if len(chunks) <= 1:
+        # Un solo bloque: no vale la pena levantar procesos
+        render_chunk(cards, out_path, layout)
+        if progress: progress(len(cards))
+        return
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        paths = [os.path.join(tmp_dir, f"{n:05d}.pdf") for n in range(len(chunks))]
+        # 'spawn' evita heredar hilos y conexiones del worker web
+        ctx = multiprocessing.get_context("spawn")
+        with ProcessPoolExecutor(max_workers=CARD_WORKERS, mp_context=ctx) as pool:
+            futures = [pool.submit(render_chunk, chunk, path, layout) for chunk, path in zip(chunks, paths)]
+            for future in as_completed(futures):
+                done = future.result()
+                if progress: progress(done)
+        merge_pdfs(paths, out_path)
@@ -1,17 +1,140 @@
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import QueuePool
 import os
+import time
+import threading
 from dotenv import load_dotenv
 
 load_dotenv()
 
 DATABASE_URL = os.getenv("DATABASE_URL")
 
+# --- POOL DE CONEXIONES ---
+# MySQL cierra las conexiones inactivas (wait_timeout, 8h por defecto): se
+# reciclan antes y se verifican al sacarlas del pool para que el primer
+# escaneo de la mañana no falle.
+#
+# Los tres pools son POR WORKER. Máximo de conexiones de cada worker:
+#   (DB_POOL_SIZE + DB_MAX_OVERFLOW) + (DB_SCAN_POOL_SIZE + DB_SCAN_MAX_OVERFLOW) + DB_BULK_POOL_SIZE
+# y en total: workers × ese máximo, que debe quedar bajo max_connections de
+# MySQL (151 por defecto) dejando ~20 libres para migraciones y administración.
+# Los valores por defecto suman 6 + 6 + 4 = 16 por worker: 64 con 4 workers,
+# 128 con 8. Las consultas duran milisegundos: los hilos que no alcanzan
+# conexión esperan su turno (DB_POOL_TIMEOUT) en vez de abrir más.
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "3"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "3"))
+DB_SCAN_POOL_SIZE = int(os.getenv("DB_SCAN_POOL_SIZE", "3"))
+DB_SCAN_MAX_OVERFLOW = int(os.getenv("DB_SCAN_MAX_OVERFLOW", "3"))
+# Una por hilo del carril "bulk" y una por hilo de tareas (jobs.JOB_WORKERS)
+DB_BULK_POOL_SIZE = int(os.getenv("DB_BULK_POOL_SIZE", str(int(os.getenv("BULK_THREADS", "2")) + int(os.getenv("JOB_WORKERS", "2")))))
+DB_POOL_TIMEOUT = int(os.getenv("DB_POOL_TIMEOUT", "10"))      # Segundos esperando conexión libre
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))    # Segundos de vida de una conexión
+DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "true").lower() in ("1", "true", "yes")
+
+
+class PoolMetrics:
+    """Contadores del pool: esperas por conexión, desbordes y timeouts."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.checkouts = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+        self.slow_waits = 0        # Esperas de más de 100 ms
+        self.overflow_events = 0   # Conexiones abiertas por encima de pool_size
+        self.timeouts = 0
+        self.invalidated = 0       # Conexiones caídas detectadas (pre-ping / errores)
+
+    def record_wait(self, seconds: float, overflow: bool):
+        with self._lock:
+            self.checkouts += 1
+            self.wait_total += seconds
+            self.wait_max = max(self.wait_max, seconds)
+            if seconds > 0.1:
+                self.slow_waits += 1
+            if overflow:
+                self.overflow_events += 1
+
+    def record_timeout(self):
+        with self._lock:
+            self.timeouts += 1
+
+    def record_invalidated(self):
+        with self._lock:
+            self.invalidated += 1
+
+
+class MeteredQueuePool(QueuePool):
+    """QueuePool que mide cuánto se espera por una conexión."""
+
+    metrics: PoolMetrics = None
+
+    def _do_get(self):
+        start = time.perf_counter()
+        # _overflow arranca en -pool_size y sube con cada conexión nueva: solo es
+        # desborde si esta llamada abrió una conexión por encima de pool_size
+        overflow_before = self._overflow
+        try:
+            conn = super()._do_get()
+        except PoolTimeoutError:
+            self.metrics.record_timeout()
+            raise
+        self.metrics.record_wait(time.perf_counter() - start, self._overflow > max(overflow_before, 0))
+        return conn
+
+
+def create_pooled_engine(url: str, pool_size: int, max_overflow: int, metrics: PoolMetrics = None):
+    """Motor con pool medido y la configuración común (timeout, recycle, pre-ping)."""
+    metrics = metrics or PoolMetrics()
+    pool_class = type("MeteredQueuePool", (MeteredQueuePool,), {"metrics": metrics})
+    new_engine = create_engine(
+        url,
+        poolclass=pool_class,
+        pool_size=pool_size,
+        max_overflow=max_overflow,
+        pool_timeout=DB_POOL_TIMEOUT,
+        pool_recycle=DB_POOL_RECYCLE,
+        pool_pre_ping=DB_POOL_PRE_PING,
+    )
+    event.listen(new_engine, "invalidate", lambda *args: metrics.record_invalidated())
+    return new_engine
+
+
+def pool_stats(target_engine) -> dict:
+    """Estado actual del pool y contadores acumulados."""
+    pool = target_engine.pool
+    metrics = pool.metrics
+    return {
+        "pool_size": pool.size(),
+        "max_overflow": pool._max_overflow,
+        "checked_out": pool.checkedout(),
+        "idle": pool.checkedin(),
+        "overflow": max(pool.overflow(), 0),
+        "checkouts": metrics.checkouts,
+        "wait_avg_ms": round(metrics.wait_total / metrics.checkouts * 1000, 2) if metrics.checkouts else 0,
+        "wait_max_ms": round(metrics.wait_max * 1000, 2),
+        "slow_waits": metrics.slow_waits,
+        "overflow_events": metrics.overflow_events,
+        "timeouts": metrics.timeouts,
+        "invalidated": metrics.invalidated,
+    }
+
+
 # Conexión a MySQL
-engine = create_engine(DATABASE_URL)
+engine = create_pooled_engine(DATABASE_URL, DB_POOL_SIZE, DB_MAX_OVERFLOW)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+# Carriles (ver lanes.py): los escaneos tienen conexiones reservadas y el trabajo
+# pesado (exportaciones, tareas en segundo plano) un pool pequeño con tope.
+scan_engine = create_pooled_engine(DATABASE_URL, DB_SCAN_POOL_SIZE, DB_SCAN_MAX_OVERFLOW)
+ScanSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=scan_engine)
+
+bulk_engine = create_pooled_engine(DATABASE_URL, DB_BULK_POOL_SIZE, 0)
+BulkSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=bulk_engine)
+
 Base = declarative_base()
 
 # Dependencia para obtener la sesión de BD en cada petición
@@ -20,4 +143,11 @@ def get_db():
     try:
         yield db
     finally:
-        db.close()
\ No newline at end of file
+        db.close()
+
+def get_bulk_db():
+    db = BulkSessionLocal()
+    try:
+        yield db
+    finally:
+        db.close()
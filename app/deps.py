@@ -1,14 +1,94 @@
 from fastapi import Depends, HTTPException, status, Request
+from fastapi.concurrency import run_in_threadpool
 from jose import jwt, JWTError
 from sqlalchemy.orm import Session
-from . import database, models, auth
+from types import SimpleNamespace
+from collections import OrderedDict
+import os
+import time
+import threading
+from . import database, models, auth, lanes
 from .models import UserRole
 
-def get_current_user(request: Request, db: Session = Depends(database.get_db)):
+# --- CACHÉ DE SESIONES ---
+# El escáner envía la misma cookie cientos de veces por turno: el token ya
+# decodificado y los datos del usuario se recuerdan por token. Los cambios en
+# usuarios invalidan la caché de este worker; los demás la renuevan a más
+# tardar en USER_CACHE_TTL segundos. Las rutas de administración no usan la
+# caché (require_admin), así que un usuario degradado o desactivado pierde
+# esos permisos de inmediato en todos los workers.
+USER_CACHE_TTL = int(os.getenv("USER_CACHE_TTL", "15"))
+USER_CACHE_SIZE = 1024
+
+_user_cache = OrderedDict()   # token -> (expira, usuario)
+_user_cache_lock = threading.Lock()
+
+def _cache_get(token: str):
+    entry = _user_cache.get(token)
+    if entry is None:
+        return None
+    if entry[0] <= time.time():
+        with _user_cache_lock:
+            _user_cache.pop(token, None)
+        return None
+    with _user_cache_lock:
+        if token in _user_cache:
+            _user_cache.move_to_end(token)
+    return entry[1]
+
+def _cache_put(token: str, expires: float, user):
+    with _user_cache_lock:
+        _user_cache[token] = (expires, user)
+        _user_cache.move_to_end(token)
+        while len(_user_cache) > USER_CACHE_SIZE:
+            _user_cache.popitem(last=False)
+
+def invalidate_user(user_id: int):
+    """Olvida las sesiones en caché de un usuario (al editarlo o borrarlo)."""
+    with _user_cache_lock:
+        for token in [t for t, (_, u) in _user_cache.items() if u.id == user_id]:
+            del _user_cache[token]
+
+async def get_current_user(request: Request):
+    """
+    Usuario de la petición (o None). Se resuelve una sola vez por petición y
+    queda en request.state.user para las rutas y plantillas.
+    Con el token en caché no se usa ningún hilo ni conexión; si no, se consulta
+    la BD en el threadpool general.
+    """
+    return await _resolve_user(request, lambda: run_in_threadpool(_fetch_user, request, database.SessionLocal))
+
+async def get_scan_user(request: Request):
+    """Igual que get_current_user, pero la consulta (si hace falta) va por el carril y el pool de escaneo."""
+    return await _resolve_user(request, lambda: lanes.run_in("scan", _fetch_user, request, database.ScanSessionLocal))
+
+async def _resolve_user(request: Request, fetch):
+    if hasattr(request.state, "user"):
+        return request.state.user
+    token = request.cookies.get("access_token")
+    user = _cache_get(token) if token else None
+    if user is None and token:
+        user = await fetch()
+    request.state.user = user
+    return user
+
+def _fetch_user(request: Request, session_factory):
+    db = session_factory()
+    try:
+        return _load_user(request, db)
+    finally:
+        db.close()
+
+def _load_user(request: Request, db: Session, use_cache: bool = True):
     token = request.cookies.get("access_token")
     if not token:
         return None # No logueado
-    
+
+    if use_cache:
+        cached = _cache_get(token)
+        if cached is not None:
+            return cached
+
     try:
         scheme, _, param = token.partition(" ")
         payload = jwt.decode(param, auth.SECRET_KEY, algorithms=[auth.ALGORITHM])
@@ -19,10 +99,25 @@ def get_current_user(request: Request, db: Session = Depends(database.get_db)):
         return None
 
     user = db.query(models.User).filter(models.User.username == username).first()
-    return user
+    if not user or user.is_active is False:
+        with _user_cache_lock:
+            _user_cache.pop(token, None)
+        return None
+
+    # Copia sin sesión de BD: se comparte entre peticiones
+    snapshot = SimpleNamespace(
+        id=user.id,
+        username=user.username,
+        full_name=user.full_name,
+        role=user.role,
+        is_active=user.is_active,
+    )
+    # Nunca más allá del vencimiento del token
+    expires = min(time.time() + USER_CACHE_TTL, payload.get("exp", 0) or float("inf"))
+    _cache_put(token, expires, snapshot)
+    return snapshot
 
-# Dependencia estricta (lanza error si no hay usuario)
-def require_user(user: models.User = Depends(get_current_user)):
+def _check_user(user):
     if not user:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
@@ -30,7 +125,19 @@ def require_user(user: models.User = Depends(get_current_user)):
         )
     return user
 
-def require_admin(user: models.User = Depends(require_user)):
+# Dependencias estrictas (lanzan error si no hay usuario). Son async: la
+# verificación no pasa por el threadpool.
+async def require_user(user: models.User = Depends(get_current_user)):
+    return _check_user(user)
+
+# Escáner de portería y comedor: si el token no está en caché, consulta por el carril "scan"
+async def require_scan_user(user: models.User = Depends(get_scan_user)):
+    return _check_user(user)
+
+def require_admin(request: Request, db: Session = Depends(database.get_db)):
+    # Siempre contra la BD: la caché de otro worker puede tener el rol anterior
+    user = _load_user(request, db, use_cache=False)
+    request.state.user = _check_user(user)
     # Comparamos el valor del enum o el string
     if user.role != UserRole.ADMIN:
         raise HTTPException(
@@ -40,13 +147,13 @@ def require_admin(user: models.User = Depends(require_user)):
     return user
 
 # Nuevo: Permiso para ver cosas de Almuerzos (Admin + Operador Almuerzo)
-def require_lunch_access(user: models.User = Depends(require_user)):
+async def require_lunch_access(user: models.User = Depends(require_scan_user)):
     if user.role not in [models.UserRole.ADMIN, models.UserRole.LUNCH_OP]:
         raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Requiere acceso a Comedor")
     return user
 
 # Nuevo: Permiso para ver cosas de Salidas (Admin + Operador Salida)
-def require_exit_access(user: models.User = Depends(require_user)):
+async def require_exit_access(user: models.User = Depends(require_scan_user)):
     if user.role not in [models.UserRole.ADMIN, models.UserRole.OPERATOR]:
         raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Requiere acceso a Portería")
     return user
\ No newline at end of file
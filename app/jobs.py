@@ -0,0 +1,237 @@
+"""
+Tareas en segundo plano.
+Las importaciones y lotes pesados se ejecutan en un pool de hilos dedicado,
+fuera de la petición HTTP. El estado se guarda en la tabla `jobs` para que
+cualquier worker pueda responder la consulta de progreso.
+
+Cada worker renueva periódicamente heartbeat_at de las tareas que tiene en cola
+o en curso. Si un worker se cae, sus tareas dejan de renovarse y el barrido de
+cualquier otro worker (o del mismo al reiniciar) las marca como fallidas.
+"""
+import os
+import json
+import time
+import uuid
+import shutil
+import tempfile
+import threading
+import traceback
+from datetime import datetime, timedelta
+from concurrent.futures import ThreadPoolExecutor
+from .database import SessionLocal, BulkSessionLocal
+from .models import Job, JobStatus
+
+# --- CONFIGURACIÓN ---
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "2"))
+MAX_STORED_ERRORS = 100      # Errores guardados por tarea (el resto solo se cuentan)
+PROGRESS_INTERVAL = 0.5      # Segundos mínimos entre escrituras de progreso
+JOB_HEARTBEAT_INTERVAL = int(os.getenv("JOB_HEARTBEAT_INTERVAL", "60"))  # Segundos entre señales de vida
+JOB_ORPHAN_AFTER = JOB_HEARTBEAT_INTERVAL * 3  # Sin señal por este tiempo = el worker murió
+
+_executor = ThreadPoolExecutor(max_workers=JOB_WORKERS, thread_name_prefix="job")
+
+# Tareas en cola o en curso en este worker (las que renueva la señal de vida)
+_active = set()
+_active_lock = threading.Lock()
+
+
+class JobContext:
+    """
+    Se entrega a la función de la tarea para reportar avance.
+    Usa su propia sesión, así el progreso se ve aunque la tarea no haya hecho commit.
+    """
+
+    def __init__(self, job_id: str):
+        self.job_id = job_id
+        self.total = 0
+        self.processed = 0
+        self.errors = []
+        self.error_count = 0
+        self.message = None
+        self.result_url = None
+        self._last_flush = 0.0
+
+    def set_total(self, total: int):
+        self.total = total
+        self.flush(force=True)
+
+    def advance(self, count: int = 1):
+        self.processed += count
+        self.flush()
+
+    def error(self, message: str):
+        self.error_count += 1
+        if len(self.errors) < MAX_STORED_ERRORS:
+            self.errors.append(message)
+        self.flush()
+
+    def finish(self, message: str = None, result_url: str = None):
+        self.message = message
+        self.result_url = result_url
+
+    def flush(self, force: bool = False, **extra):
+        now = time.monotonic()
+        if not force and now - self._last_flush < PROGRESS_INTERVAL:
+            return
+        self._last_flush = now
+        _update_job(
+            self.job_id,
+            total=self.total,
+            processed=self.processed,
+            error_count=self.error_count,
+            errors=json.dumps(self.errors, ensure_ascii=False) if self.errors else None,
+            **extra
+        )
+
+
+def _update_job(job_id: str, **values):
+    db = SessionLocal()
+    try:
+        db.query(Job).filter(Job.id == job_id).update(values, synchronize_session=False)
+        db.commit()
+    finally:
+        db.close()
+
+
+def _run(job_id: str, fn, args, kwargs):
+    ctx = JobContext(job_id)
+    _update_job(job_id, status=JobStatus.RUNNING.value, started_at=datetime.now())
+    # El trabajo usa el pool "bulk"; el progreso va por el pool general
+    db = BulkSessionLocal()
+    try:
+        fn(ctx, db, *args, **kwargs)
+        ctx.flush(force=True, status=JobStatus.DONE.value, message=ctx.message,
+                  result_url=ctx.result_url, finished_at=datetime.now())
+    except Exception as e:
+        traceback.print_exc()
+        db.rollback()
+        ctx.error(f"Error general: {e}")
+        ctx.flush(force=True, status=JobStatus.FAILED.value, message="La tarea falló",
+                  result_url=ctx.result_url, finished_at=datetime.now())
+    finally:
+        db.close()
+        with _active_lock:
+            _active.discard(job_id)
+
+
+def submit(kind: str, fn, *args, user=None, result_url: str = None, **kwargs) -> str:
+    """
+    Registra y encola una tarea. fn(job, db, *args, **kwargs) se ejecuta en el pool;
+    recibe un JobContext y una sesión de BD propia (debe hacer commit).
+    result_url: enlace por defecto para volver cuando termine.
+    Retorna el ID de la tarea.
+    """
+    job_id = uuid.uuid4().hex
+    db = SessionLocal()
+    try:
+        db.add(Job(
+            id=job_id,
+            kind=kind,
+            status=JobStatus.PENDING.value,
+            result_url=result_url,
+            created_by=user.id if user else None,
+            heartbeat_at=datetime.now(),
+        ))
+        db.commit()
+    finally:
+        db.close()
+    with _active_lock:
+        _active.add(job_id)
+    _executor.submit(_run, job_id, fn, args, kwargs)
+    return job_id
+
+
+def spool_upload(upload, suffix: str = "") -> str:
+    """
+    Copia un archivo subido a un temporal propio y retorna su ruta.
+    El de la petición se borra al responder; la tarea debe borrar la copia al terminar.
+    """
+    with tempfile.NamedTemporaryFile(suffix=suffix, delete=False) as tmp:
+        shutil.copyfileobj(upload.file, tmp)
+    return tmp.name
+
+
+def heartbeat(db):
+    """
+    Renueva la señal de vida de las tareas de este worker y marca como fallidas
+    las que nadie renueva (su worker se cayó o se reinició a mitad de la tarea).
+    """
+    now = datetime.now()
+    with _active_lock:
+        active = list(_active)
+    if active:
+        db.query(Job).filter(Job.id.in_(active)).update({"heartbeat_at": now}, synchronize_session=False)
+
+    cutoff = now - timedelta(seconds=JOB_ORPHAN_AFTER)
+    orphans = db.query(Job).filter(
+        Job.status.in_([JobStatus.PENDING.value, JobStatus.RUNNING.value]),
+        (Job.heartbeat_at.is_(None)) | (Job.heartbeat_at < cutoff),
+    )
+    if active:
+        orphans = orphans.filter(Job.id.notin_(active))
+    count = orphans.update({
+        "status": JobStatus.FAILED.value,
+        "message": "La tarea se interrumpió: el servidor se reinició",
+        "finished_at": now,
+    }, synchronize_session=False)
+    db.commit()
+    if count:
+        print(f"[JOBS] {count} tareas huérfanas marcadas como fallidas")
+
+
+def start_heartbeat():
+    """Barre las tareas huérfanas al arrancar y luego cada JOB_HEARTBEAT_INTERVAL segundos."""
+    def loop():
+        while True:
+            db = SessionLocal()
+            try:
+                heartbeat(db)
+            except Exception:
+                traceback.print_exc()  # BD aún no disponible: se reintenta en el siguiente ciclo
+            finally:
+                db.close()
+            time.sleep(JOB_HEARTBEAT_INTERVAL)
+
+    threading.Thread(target=loop, daemon=True, name="job-heartbeat").start()
+
+
+def job_status(job: Job) -> dict:
+    """Estado serializable de una tarea, con ETA estimado."""
+    eta_seconds = None
+    if job.status == JobStatus.RUNNING.value and job.started_at and job.total and job.processed:
+        elapsed = (datetime.now() - job.started_at.replace(tzinfo=None)).total_seconds()
+        remaining = max(job.total - job.processed, 0)
+        eta_seconds = int(elapsed / job.processed * remaining)
+
+    return {
+        "id": job.id,
+        "kind": job.kind,
+        "status": job.status,
+        "total": job.total or 0,
+        "processed": job.processed or 0,
+        "error_count": job.error_count or 0,
+        "errors": json.loads(job.errors) if job.errors else [],
+        "eta_seconds": eta_seconds,
+        "message": job.message,
+        "result_url": job.result_url,
+        "finished": job.status in (JobStatus.DONE.value, JobStatus.FAILED.value),
+    }
+
+
+def schedule(interval: int, fn):
+    """
+    Ejecuta fn(db) cada `interval` segundos en un hilo daemon (tareas de mantenimiento).
+    Cada worker tiene el suyo, así que fn debe poder repetirse sin problema.
+    """
+    def loop():
+        while True:
+            time.sleep(interval)
+            db = SessionLocal()
+            try:
+                fn(db)
+            except Exception:
+                traceback.print_exc()
+            finally:
+                db.close()
+
+    threading.Thread(target=loop, daemon=True, name=f"schedule-{fn.__name__}").start()
@@ -0,0 +1,71 @@
+"""
+Carriles de ejecución.
+Los escaneos de portería y comedor no pueden esperar detrás de una exportación
+de un año o de un lote de carnets. Cada carril tiene su propio cupo de hilos
+(y su propio pool de conexiones en database.py):
+- scan: cupo reservado solo para /scan/process y /lunch/process.
+- bulk: exportaciones, reportes y PDFs; con tope para que nunca agoten
+  los hilos ni las conexiones del resto de la aplicación.
+  Sus tareas de CPU usan como máximo BULK_PROCESSES procesos.
+- login: verificación de contraseñas (PBKDF2 consume CPU a propósito); con
+  tope para que un cambio de turno no acapare todos los núcleos.
+"""
+import os
+import functools
+import anyio
+import anyio.to_thread
+
+# --- CONFIGURACIÓN ---
+LANE_THREADS = {
+    "scan": int(os.getenv("SCAN_THREADS", "16")),
+    "bulk": int(os.getenv("BULK_THREADS", "2")),
+    "login": int(os.getenv("LOGIN_THREADS", "2")),
+}
+# Procesos para el trabajo de CPU del carril bulk (lotes de carnets, fotos).
+# Por defecto la mitad de los núcleos: el resto queda para los workers web y
+# los escaneos. CARD_WORKERS / PHOTO_WORKERS lo reemplazan para cada tarea.
+BULK_PROCESSES = int(os.getenv("BULK_PROCESSES", "0")) or max(1, (os.cpu_count() or 2) // 2)
+
+_limiters = {}
+
+def _limiter(lane: str) -> anyio.CapacityLimiter:
+    # Se crean dentro del event loop (anyio lo exige)
+    limiter = _limiters.get(lane)
+    if limiter is None:
+        limiter = _limiters[lane] = anyio.CapacityLimiter(LANE_THREADS[lane])
+    return limiter
+
+async def run_in(lane: str, fn, *args, **kwargs):
+    """Ejecuta una función bloqueante en un hilo del carril indicado."""
+    return await anyio.to_thread.run_sync(functools.partial(fn, *args, **kwargs), limiter=_limiter(lane))
+
+def bulk(fn):
+    """
+    Decorador para rutas síncronas pesadas: la ruta se ejecuta en el carril
+    bulk en vez del pool de hilos general. Conserva la firma para FastAPI.
+    """
+    @functools.wraps(fn)
+    async def wrapper(*args, **kwargs):
+        return await run_in("bulk", fn, *args, **kwargs)
+    return wrapper
+
+async def iterate_in(lane: str, iterator):
+    """Recorre un generador bloqueante (respuestas en streaming) dentro de un carril."""
+    iterator = iter(iterator)
+    done = object()
+    while True:
+        chunk = await run_in(lane, next, iterator, done)
+        if chunk is done:
+            break
+        yield chunk
+
+def lane_stats() -> dict:
+    stats = {}
+    for lane, threads in LANE_THREADS.items():
+        limiter = _limiters.get(lane)
+        stats[lane] = {
+            "threads": threads,
+            "busy": limiter.borrowed_tokens if limiter else 0,
+            "waiting": limiter.statistics().tasks_waiting if limiter else 0,
+        }
+    return stats
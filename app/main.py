@@ -1,29 +1,34 @@
-from fastapi import FastAPI, Request, Response
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, Depends
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import RedirectResponse
-from .database import engine
-from .routers import auth, dashboard, students, cards, scan, doors, reports, users, employees, lunch
-from . import models, deps
+from fastapi.responses import RedirectResponse, JSONResponse
+from .routers import auth, dashboard, students, cards, scan, doors, reports, users, employees, lunch, jobs, system
+from . import models, deps, warmup, sqltrace
+from .jobs import schedule, start_heartbeat
 
-models.Base.metadata.create_all(bind=engine)
+# El esquema se crea y actualiza con `python migrate.py` (una vez por despliegue),
+# no al importar: con varios workers create_all competía consigo mismo.
 
-app = FastAPI(title="School Guard")
+AUTH_EXPIRY_INTERVAL = 60 # Segundos entre revisiones de autorizaciones temporales
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Conexiones, mappers, plantillas y cachés del escáner (ver /readyz)
+    warmup.start()
+    # Tareas periódicas de mantenimiento
+    start_heartbeat()
+    schedule(AUTH_EXPIRY_INTERVAL, students.revert_expired_authorizations)
+    yield
+
+app = FastAPI(title="School Guard", lifespan=lifespan)
 
 app.mount("/static", StaticFiles(directory="app/static"), name="static")
 
-# Middleware para inyectar el usuario en cada request
-@app.middleware("http")
-async def add_user_to_request(request: Request, call_next):
-    # Usamos la lógica de deps.get_current_user manualmente aquí
-    # para no bloquear rutas públicas, pero tener el usuario si existe.
-    from app.database import SessionLocal
-    db = SessionLocal()
-    user = deps.get_current_user(request, db)
-    request.state.user = user
-    db.close()
-    
-    response = await call_next(request)
-    return response
+# Consultas y tiempo de BD por petición (encabezado Server-Timing y avisos de N+1)
+app.add_middleware(sqltrace.SQLTraceMiddleware)
+
+# El usuario se resuelve en deps.get_current_user (dependencia de cada router),
+# así los archivos estáticos y las rutas públicas no tocan la base de datos.
 
 app.include_router(auth.router)
 app.include_router(dashboard.router)
@@ -35,9 +40,27 @@ app.include_router(reports.router)
 app.include_router(users.router)
 app.include_router(employees.router) 
 app.include_router(lunch.router)
+app.include_router(jobs.router)
+app.include_router(system.router)
+
+@app.get("/healthz")
+def healthz():
+    """Liveness: el proceso responde (no toca la base de datos)."""
+    return {"status": "ok"}
+
+@app.get("/readyz")
+def readyz():
+    """Readiness: 200 solo cuando terminó el calentamiento del worker."""
+    body = {
+        "ready": warmup.state["ready"],
+        "seconds": warmup.state["seconds"],
+        "steps": warmup.state["steps"],
+        "error": warmup.state["error"],
+    }
+    return JSONResponse(body, status_code=200 if body["ready"] else 503)
 
 @app.get("/")
-def root(request: Request):
-    if request.state.user:
+def root(user: models.User = Depends(deps.get_current_user)):
+    if user:
         return RedirectResponse("/dashboard")
     return RedirectResponse("/login") # Asumiendo que auth.router maneja /login o la raiz
\ No newline at end of file
@@ -0,0 +1,80 @@
+"""
+Esquema original (antes de las migraciones), congelado.
+No usa models.py: si usara los modelos actuales, una base nueva nacería con
+todas las columnas e índices y las migraciones siguientes no harían nada, así
+que nunca se probarían. En una base existente solo crea las tablas que falten.
+"""
+import sqlalchemy as sa
+
+DESCRIPTION = "Tablas base"
+
+metadata = sa.MetaData()
+
+sa.Table(
+    "users", metadata,
+    sa.Column("id", sa.Integer, primary_key=True, index=True),
+    sa.Column("username", sa.String(50), unique=True, index=True, nullable=False),
+    sa.Column("full_name", sa.String(100)),
+    sa.Column("hashed_password", sa.String(255), nullable=False),
+    sa.Column("role", sa.Enum("ADMIN", "OPERATOR", "LUNCH_OP", name="userrole")),
+    sa.Column("is_active", sa.Boolean),
+    sa.Column("created_at", sa.DateTime(timezone=True), server_default=sa.func.now()),
+)
+
+sa.Table(
+    "students", metadata,
+    sa.Column("id", sa.Integer, primary_key=True, index=True),
+    sa.Column("student_id", sa.String(20), unique=True, index=True, nullable=False),
+    sa.Column("full_name", sa.String(100), nullable=False),
+    sa.Column("course", sa.String(20), nullable=False),
+    sa.Column("is_authorized", sa.Boolean),
+    sa.Column("photo_path", sa.String(255)),
+    sa.Column("rfid_code", sa.String(50), unique=True, index=True),
+    sa.Column("has_lunch", sa.Boolean),
+    sa.Column("lunch_type", sa.String(20)),
+    sa.Column("created_at", sa.DateTime(timezone=True), server_default=sa.func.now()),
+)
+
+sa.Table(
+    "employees", metadata,
+    sa.Column("id", sa.Integer, primary_key=True, index=True),
+    sa.Column("doc_id", sa.String(20), unique=True, index=True, nullable=False),
+    sa.Column("full_name", sa.String(100), nullable=False),
+    sa.Column("position", sa.String(50)),
+    sa.Column("photo_path", sa.String(255)),
+    sa.Column("rfid_code", sa.String(50), unique=True, index=True),
+    sa.Column("has_lunch", sa.Boolean),
+    sa.Column("lunch_type", sa.String(20)),
+    sa.Column("created_at", sa.DateTime(timezone=True), server_default=sa.func.now()),
+)
+
+sa.Table(
+    "doors", metadata,
+    sa.Column("id", sa.Integer, primary_key=True, index=True),
+    sa.Column("name", sa.String(50), unique=True, nullable=False),
+    sa.Column("description", sa.String(100)),
+    sa.Column("is_active", sa.Boolean),
+)
+
+sa.Table(
+    "exit_logs", metadata,
+    sa.Column("id", sa.Integer, primary_key=True, index=True),
+    sa.Column("student_id", sa.Integer, sa.ForeignKey("students.id"), nullable=False),
+    sa.Column("operator_id", sa.Integer, sa.ForeignKey("users.id"), nullable=False),
+    sa.Column("door_id", sa.Integer, sa.ForeignKey("doors.id"), nullable=False),
+    sa.Column("timestamp", sa.DateTime(timezone=True), nullable=False),
+)
+
+sa.Table(
+    "lunch_logs", metadata,
+    sa.Column("id", sa.Integer, primary_key=True, index=True),
+    sa.Column("student_id", sa.Integer, sa.ForeignKey("students.id")),
+    sa.Column("employee_id", sa.Integer, sa.ForeignKey("employees.id")),
+    sa.Column("operator_id", sa.Integer, sa.ForeignKey("users.id"), nullable=False),
+    sa.Column("timestamp", sa.DateTime(timezone=True), nullable=False),
+    sa.Column("delivered_type", sa.String(20), nullable=False),
+)
+
+
+def upgrade(conn):
+    metadata.create_all(bind=conn, checkfirst=True)
@@ -0,0 +1,11 @@
+"""Control de almuerzos en estudiantes (antes update_tables.sql, sección 1)."""
+from . import ops
+
+DESCRIPTION = "Columnas de almuerzo y RFID en estudiantes"
+
+
+def upgrade(conn):
+    ops.add_column(conn, "students", "rfid_code", "VARCHAR(50) DEFAULT NULL")
+    ops.add_column(conn, "students", "has_lunch", "BOOLEAN DEFAULT FALSE")
+    ops.add_column(conn, "students", "lunch_type", "VARCHAR(20) DEFAULT 'Ninguno'")
+    ops.add_index(conn, "students", "ix_students_rfid_code", ["rfid_code"], unique=True)
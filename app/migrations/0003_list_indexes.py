@@ -0,0 +1,11 @@
+"""Listados por cursor y búsqueda por nombre (antes update_tables.sql, sección 5)."""
+from . import ops
+
+DESCRIPTION = "Índices de listados y búsqueda FULLTEXT"
+
+
+def upgrade(conn):
+    ops.add_index(conn, "students", "ix_students_created_at_id", ["created_at", "id"])
+    ops.add_index(conn, "students", "ft_students_full_name", ["full_name"], fulltext=True)
+    ops.add_index(conn, "employees", "ix_employees_full_name_id", ["full_name", "id"])
+    ops.add_index(conn, "employees", "ft_employees_full_name", ["full_name"], fulltext=True)
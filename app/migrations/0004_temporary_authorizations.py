@@ -0,0 +1,18 @@
+"""Autorizaciones temporales y filtros guardados (antes update_tables.sql, sección 6)."""
+import sqlalchemy as sa
+from . import ops
+
+DESCRIPTION = "Autorizaciones temporales y filtros guardados"
+
+
+def upgrade(conn):
+    ops.add_column(conn, "students", "auth_expires_at", "DATETIME DEFAULT NULL")
+    ops.add_index(conn, "students", "ix_students_course", ["course"])
+    ops.create_table(
+        conn, "student_filters",
+        sa.Column("id", sa.Integer, primary_key=True, index=True),
+        sa.Column("name", sa.String(50), unique=True, nullable=False),
+        sa.Column("course", sa.String(20)),
+        sa.Column("q", sa.String(100)),
+        sa.Column("created_at", sa.DateTime(timezone=True), server_default=sa.func.now()),
+    )
@@ -0,0 +1,16 @@
+"""Fecha de modificación para lotes "cambiados desde" (antes update_tables.sql, sección 7)."""
+from . import ops
+
+DESCRIPTION = "Columna updated_at en estudiantes y empleados"
+
+
+def upgrade(conn):
+    if conn.dialect.name == "mysql":
+        ddl = "DATETIME DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP"
+    else:
+        # SQLite (pruebas locales) no admite ON UPDATE ni un DEFAULT no constante
+        # al agregar columnas: ahí lo asigna el ORM (onupdate de models.py)
+        ddl = "DATETIME DEFAULT NULL"
+    for table in ("students", "employees"):
+        ops.add_column(conn, table, "updated_at", ddl)
+        ops.add_index(conn, table, f"ix_{table}_updated_at", ["updated_at"])
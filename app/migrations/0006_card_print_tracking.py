@@ -0,0 +1,22 @@
+"""Control de impresión de carnets (antes update_tables.sql, sección 8)."""
+import sqlalchemy as sa
+from . import ops
+
+DESCRIPTION = "Registro de carnets impresos"
+
+
+def upgrade(conn):
+    for table in ("students", "employees"):
+        ops.add_column(conn, table, "card_printed_at", "DATETIME DEFAULT NULL")
+        ops.add_column(conn, table, "card_fingerprint", "VARCHAR(40) DEFAULT NULL")
+    ops.create_table(
+        conn, "card_print_runs",
+        sa.Column("id", sa.Integer, primary_key=True, index=True),
+        sa.Column("kind", sa.String(20), nullable=False),
+        sa.Column("job_id", sa.String(32)),
+        sa.Column("card_count", sa.Integer),
+        sa.Column("only_changed", sa.Boolean),
+        sa.Column("filters", sa.String(255)),
+        sa.Column("created_by", sa.Integer, sa.ForeignKey("users.id")),
+        sa.Column("created_at", sa.DateTime(timezone=True), server_default=sa.func.now()),
+    )
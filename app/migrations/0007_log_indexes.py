@@ -0,0 +1,19 @@
+"""
+Índices de los registros de salida y almuerzo.
+exit_logs crece a millones de filas: se crean en línea (ALGORITHM=INPLACE, LOCK=NONE),
+la portería sigue registrando salidas mientras tanto.
+"""
+from . import ops
+
+DESCRIPTION = "Índices de exit_logs y lunch_logs"
+
+
+def upgrade(conn):
+    # Anti-passback: última salida de un estudiante
+    ops.add_index(conn, "exit_logs", "ix_exit_logs_student_id_timestamp", ["student_id", "timestamp"])
+    # Reportes y dashboard por rango de fechas
+    ops.add_index(conn, "exit_logs", "ix_exit_logs_timestamp", ["timestamp"])
+    # ¿Ya almorzó hoy?
+    ops.add_index(conn, "lunch_logs", "ix_lunch_logs_student_id_timestamp", ["student_id", "timestamp"])
+    ops.add_index(conn, "lunch_logs", "ix_lunch_logs_employee_id_timestamp", ["employee_id", "timestamp"])
+    ops.add_index(conn, "lunch_logs", "ix_lunch_logs_timestamp", ["timestamp"])
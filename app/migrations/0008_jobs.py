@@ -0,0 +1,28 @@
+"""
+Tareas en segundo plano (antes update_tables.sql, sección 4) y su señal de vida,
+que detecta las que quedaron huérfanas al caerse un worker.
+"""
+import sqlalchemy as sa
+from . import ops
+
+DESCRIPTION = "Tabla de tareas en segundo plano (jobs) con señal de vida"
+
+
+def upgrade(conn):
+    ops.create_table(
+        conn, "jobs",
+        sa.Column("id", sa.String(32), primary_key=True),
+        sa.Column("kind", sa.String(50), nullable=False),
+        sa.Column("status", sa.String(20), nullable=False),
+        sa.Column("total", sa.Integer),
+        sa.Column("processed", sa.Integer),
+        sa.Column("error_count", sa.Integer),
+        sa.Column("errors", sa.Text),
+        sa.Column("message", sa.String(255)),
+        sa.Column("result_url", sa.String(255)),
+        sa.Column("created_by", sa.Integer, sa.ForeignKey("users.id")),
+        sa.Column("created_at", sa.DateTime(timezone=True), server_default=sa.func.now()),
+        sa.Column("started_at", sa.DateTime(timezone=True)),
+        sa.Column("finished_at", sa.DateTime(timezone=True)),
+    )
+    ops.add_column(conn, "jobs", "heartbeat_at", "DATETIME DEFAULT NULL")
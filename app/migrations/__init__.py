@@ -0,0 +1,106 @@
+"""
+Migraciones versionadas del esquema.
+Cada archivo NNNN_nombre.py de esta carpeta define DESCRIPTION y upgrade(conn).
+Las versiones aplicadas se registran en la tabla schema_migrations.
+
+Se ejecutan una sola vez por despliegue con `python migrate.py`, antes de
+reiniciar los workers (la app ya no crea tablas al importarse).
+En MySQL un candado (GET_LOCK) evita que dos despliegues migren a la vez.
+"""
+import re
+import time
+import pkgutil
+import importlib
+from datetime import datetime
+from sqlalchemy import text
+
+# --- CONFIGURACIÓN ---
+SCHEMA_TABLE = "schema_migrations"
+LOCK_NAME = "school_guard_migrate"
+LOCK_TIMEOUT = 60   # Segundos esperando a que termine otra migración en curso
+_VERSION_RE = re.compile(r"^(\d{4})_(\w+)$")
+
+
+def discover():
+    """Migraciones disponibles ordenadas: [(versión, nombre, módulo)]."""
+    found = []
+    for info in pkgutil.iter_modules(__path__):
+        match = _VERSION_RE.match(info.name)
+        if match:
+            module = importlib.import_module(f"{__name__}.{info.name}")
+            found.append((int(match.group(1)), match.group(2), module))
+    found.sort(key=lambda item: item[0])
+    return found
+
+
+def _ensure_table(conn):
+    conn.execute(text(
+        f"CREATE TABLE IF NOT EXISTS {SCHEMA_TABLE} ("
+        " version INTEGER PRIMARY KEY,"
+        " name VARCHAR(100) NOT NULL,"
+        " applied_at DATETIME NOT NULL,"
+        " duration_ms INTEGER"
+        ")"
+    ))
+    conn.commit()
+
+
+def applied_versions(conn) -> set:
+    """Versiones registradas. Solo lectura: sin la tabla (base nueva) no hay ninguna."""
+    from . import ops
+
+    if not ops.has_table(conn, SCHEMA_TABLE):
+        return set()
+    return {row[0] for row in conn.execute(text(f"SELECT version FROM {SCHEMA_TABLE}"))}
+
+
+def status(engine):
+    """[(versión, nombre, descripción, aplicada)] de todas las migraciones."""
+    with engine.connect() as conn:
+        applied = applied_versions(conn)
+    return [(version, name, module.DESCRIPTION, version in applied) for version, name, module in discover()]
+
+
+def pending(engine):
+    return [(version, name) for version, name, _, done in status(engine) if not done]
+
+
+def _acquire_lock(conn):
+    if conn.dialect.name != "mysql":
+        return
+    if conn.execute(text("SELECT GET_LOCK(:name, :timeout)"), {"name": LOCK_NAME, "timeout": LOCK_TIMEOUT}).scalar() != 1:
+        raise RuntimeError("Otra migración está en curso; intente de nuevo cuando termine.")
+
+
+def _release_lock(conn):
+    if conn.dialect.name == "mysql":
+        conn.execute(text("SELECT RELEASE_LOCK(:name)"), {"name": LOCK_NAME})
+
+
+def upgrade(engine, log=print):
+    """Aplica en orden las migraciones pendientes. Retorna las versiones aplicadas."""
+    from . import ops
+
+    done = []
+    with engine.connect() as conn:
+        _acquire_lock(conn)
+        try:
+            ops.prepare_session(conn)
+            _ensure_table(conn)   # Solo upgrade() crea la tabla; status() y /readyz solo leen
+            applied = applied_versions(conn)
+            for version, name, module in discover():
+                if version in applied:
+                    continue
+                log(f" - {version:04d} {name}: {module.DESCRIPTION}")
+                start = time.perf_counter()
+                module.upgrade(conn)
+                duration_ms = int((time.perf_counter() - start) * 1000)
+                conn.execute(
+                    text(f"INSERT INTO {SCHEMA_TABLE} (version, name, applied_at, duration_ms) VALUES (:v, :n, :at, :ms)"),
+                    {"v": version, "n": name, "at": datetime.now(), "ms": duration_ms},
+                )
+                conn.commit()
+                done.append(version)
+        finally:
+            _release_lock(conn)
+    return done
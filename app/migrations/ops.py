@@ -0,0 +1,95 @@
+"""
+Operaciones de esquema para las migraciones.
+Todas son idempotentes (revisan el esquema antes de cambiarlo), así una base
+actualizada a mano con el antiguo update_tables.sql puede adoptar las migraciones.
+
+En MySQL se usa DDL en línea para no bloquear la portería durante un despliegue:
+- Columnas: ALGORITHM=INSTANT (MySQL 8); si no se puede, INPLACE sin bloqueo;
+  y si tampoco, LOCK=SHARED (lecturas siguen, escrituras esperan al ALTER).
+- Índices: ALGORITHM=INPLACE, LOCK=NONE (lecturas y escrituras siguen durante
+  la creación). FULLTEXT no admite LOCK=NONE: usa LOCK=SHARED (solo lecturas).
+- lock_wait_timeout corto: si una consulta larga tiene la tabla tomada, el ALTER
+  falla rápido en vez de quedarse esperando con todos los escaneos en cola detrás.
+"""
+import os
+from sqlalchemy import MetaData, Table, inspect, text
+from sqlalchemy.exc import DBAPIError
+
+# --- CONFIGURACIÓN ---
+MIGRATION_LOCK_WAIT_TIMEOUT = int(os.getenv("MIGRATION_LOCK_WAIT_TIMEOUT", "5"))
+
+
+def prepare_session(conn):
+    if conn.dialect.name == "mysql":
+        conn.execute(text(f"SET SESSION lock_wait_timeout = {MIGRATION_LOCK_WAIT_TIMEOUT}"))
+
+
+def has_table(conn, table: str) -> bool:
+    return inspect(conn).has_table(table)
+
+
+def create_table(conn, name: str, *columns) -> bool:
+    """
+    CREATE TABLE con columnas escritas en la migración (sa.Column), no tomadas
+    de models.py: la migración crea la tabla tal como era en esa versión.
+    """
+    if has_table(conn, name):
+        return False
+    metadata = MetaData()
+    # Las tablas referenciadas por llaves foráneas se leen de la base
+    referenced = {fk.target_fullname.split(".")[0] for col in columns for fk in col.foreign_keys}
+    if referenced:
+        metadata.reflect(bind=conn, only=sorted(referenced))
+    Table(name, metadata, *columns).create(bind=conn)
+    return True
+
+
+def has_column(conn, table: str, column: str) -> bool:
+    return any(col["name"] == column for col in inspect(conn).get_columns(table))
+
+
+def has_index(conn, table: str, name: str, columns) -> bool:
+    """Existe con ese nombre, o hay otro índice sobre exactamente las mismas columnas."""
+    inspector = inspect(conn)
+    existing = inspector.get_indexes(table) + inspector.get_unique_constraints(table)
+    return any(ix["name"] == name or list(ix["column_names"]) == list(columns) for ix in existing)
+
+
+def add_column(conn, table: str, column: str, ddl: str) -> bool:
+    """ALTER TABLE ... ADD COLUMN. ddl: tipo y opciones (ej. "DATETIME DEFAULT NULL")."""
+    if has_column(conn, table, column):
+        return False
+    statement = f"ALTER TABLE {table} ADD COLUMN {column} {ddl}"
+    if conn.dialect.name != "mysql":
+        conn.execute(text(statement))
+        return True
+    try:
+        conn.execute(text(f"{statement}, ALGORITHM=INSTANT"))
+        return True
+    except DBAPIError:
+        # MySQL 5.7 o columna no compatible con INSTANT
+        conn.rollback()
+    try:
+        conn.execute(text(f"{statement}, ALGORITHM=INPLACE, LOCK=NONE"))
+        return True
+    except DBAPIError:
+        # Ej. DEFAULT CURRENT_TIMESTAMP en 5.7: solo con copia de la tabla
+        conn.rollback()
+    print(f"   {table}.{column}: sin DDL en línea, se usa LOCK=SHARED (las escrituras esperan)")
+    conn.execute(text(f"{statement}, LOCK=SHARED"))
+    return True
+
+
+def add_index(conn, table: str, name: str, columns, unique: bool = False, fulltext: bool = False) -> bool:
+    if has_index(conn, table, name, columns):
+        return False
+    cols = ", ".join(columns)
+    if conn.dialect.name != "mysql":
+        if fulltext:
+            return False  # Solo MySQL tiene índices FULLTEXT
+        conn.execute(text(f"CREATE {'UNIQUE ' if unique else ''}INDEX {name} ON {table} ({cols})"))
+        return True
+    kind = "FULLTEXT INDEX" if fulltext else ("UNIQUE INDEX" if unique else "INDEX")
+    lock = "SHARED" if fulltext else "NONE"
+    conn.execute(text(f"ALTER TABLE {table} ADD {kind} {name} ({cols}), ALGORITHM=INPLACE, LOCK={lock}"))
+    return True
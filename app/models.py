@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Enum, Boolean, DateTime, ForeignKey
+from sqlalchemy import Column, Integer, String, Enum, Boolean, DateTime, ForeignKey, Text, Index
 from sqlalchemy.sql import func
 from sqlalchemy.orm import relationship
 from .database import Base
@@ -14,6 +14,12 @@ class LunchType(str, enum.Enum):
     ESPECIAL = "Especial"
     NONE = "Ninguno"
 
+class JobStatus(str, enum.Enum):
+    PENDING = "pendiente"
+    RUNNING = "en_proceso"
+    DONE = "terminado"
+    FAILED = "fallido"
+
 class User(Base):
     __tablename__ = "users"
 
@@ -31,8 +37,9 @@ class Student(Base):
     id = Column(Integer, primary_key=True, index=True)
     student_id = Column(String(20), unique=True, index=True, nullable=False) # Ej: Carnet 2023001
     full_name = Column(String(100), nullable=False)
-    course = Column(String(20), nullable=False) # Ej: 10A, 11B
+    course = Column(String(20), nullable=False, index=True) # Ej: 10A, 11B
     is_authorized = Column(Boolean, default=False) # ¿Puede salir?
+    auth_expires_at = Column(DateTime(timezone=True), nullable=True) # Autorización temporal: se revierte a esta hora
     photo_path = Column(String(255), nullable=True) # Ruta de la foto
     # Control Almuerzos (Nuevos campos)
     rfid_code = Column(String(50), unique=True, index=True, nullable=True) # Código del chip NFC/RFID
@@ -40,6 +47,24 @@ class Student(Base):
     lunch_type = Column(String(20), default="Ninguno")
 
     created_at = Column(DateTime(timezone=True), server_default=func.now())
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now(), index=True) # Lotes "cambiados desde"
+    card_printed_at = Column(DateTime(timezone=True), nullable=True) # Último lote de carnets que lo incluyó
+    card_fingerprint = Column(String(40), nullable=True) # Hash de los datos impresos en ese lote
+
+    __table_args__ = (
+        Index("ix_students_created_at_id", "created_at", "id"),  # Listado por cursor
+        Index("ft_students_full_name", "full_name", mysql_prefix="FULLTEXT"), # Búsqueda por nombre
+    )
+
+class StudentFilter(Base):
+    """Filtro guardado para cambios masivos (ej: 'Primaria tarde')"""
+    __tablename__ = "student_filters"
+
+    id = Column(Integer, primary_key=True, index=True)
+    name = Column(String(50), unique=True, nullable=False)
+    course = Column(String(20), nullable=True)  # Curso exacto (opcional)
+    q = Column(String(100), nullable=True)      # Búsqueda por nombre/ID (opcional)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
 
 class Employee(Base):
     __tablename__ = "employees"
@@ -56,6 +81,14 @@ class Employee(Base):
     lunch_type = Column(String(20), default="Normal")
     
     created_at = Column(DateTime(timezone=True), server_default=func.now())
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now(), index=True)
+    card_printed_at = Column(DateTime(timezone=True), nullable=True)
+    card_fingerprint = Column(String(40), nullable=True)
+
+    __table_args__ = (
+        Index("ix_employees_full_name_id", "full_name", "id"),   # Listado por cursor
+        Index("ft_employees_full_name", "full_name", mysql_prefix="FULLTEXT"), # Búsqueda por nombre
+    )
 
 class Door(Base):
     __tablename__ = "doors"
@@ -79,6 +112,11 @@ class ExitLog(Base):
     operator = relationship("User")
     door = relationship("Door")
 
+    __table_args__ = (
+        Index("ix_exit_logs_student_id_timestamp", "student_id", "timestamp"), # Anti-passback
+        Index("ix_exit_logs_timestamp", "timestamp"),                          # Reportes por fecha
+    )
+
 class LunchLog(Base):
     __tablename__ = "lunch_logs"
     
@@ -96,4 +134,42 @@ class LunchLog(Base):
 
     student = relationship("Student")
     employee = relationship("Employee")
-    operator = relationship("User")
\ No newline at end of file
+    operator = relationship("User")
+
+    __table_args__ = (
+        Index("ix_lunch_logs_student_id_timestamp", "student_id", "timestamp"),   # ¿Ya almorzó hoy?
+        Index("ix_lunch_logs_employee_id_timestamp", "employee_id", "timestamp"),
+        Index("ix_lunch_logs_timestamp", "timestamp"),
+    )
+
+class Job(Base):
+    """Tarea en segundo plano (importaciones masivas, lotes de carnets)"""
+    __tablename__ = "jobs"
+
+    id = Column(String(32), primary_key=True)  # UUID hex
+    kind = Column(String(50), nullable=False)   # Ej: "students.import"
+    status = Column(String(20), default=JobStatus.PENDING.value, nullable=False)
+    total = Column(Integer, default=0)          # Filas/elementos a procesar
+    processed = Column(Integer, default=0)
+    error_count = Column(Integer, default=0)
+    errors = Column(Text, nullable=True)        # Lista JSON (primeros errores)
+    message = Column(String(255), nullable=True)
+    result_url = Column(String(255), nullable=True) # Enlace al terminar (volver / descargar)
+    created_by = Column(Integer, ForeignKey("users.id"), nullable=True)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    started_at = Column(DateTime(timezone=True), nullable=True)
+    finished_at = Column(DateTime(timezone=True), nullable=True)
+    heartbeat_at = Column(DateTime(timezone=True), nullable=True) # Última señal del worker que la tiene en cola
+
+class CardPrintRun(Base):
+    """Registro de cada lote de carnets generado (para reimprimir solo los cambios)"""
+    __tablename__ = "card_print_runs"
+
+    id = Column(Integer, primary_key=True, index=True)
+    kind = Column(String(20), nullable=False)      # "students" / "employees"
+    job_id = Column(String(32), nullable=True)
+    card_count = Column(Integer, default=0)
+    only_changed = Column(Boolean, default=False)
+    filters = Column(String(255), nullable=True)   # Descripción de los filtros usados
+    created_by = Column(Integer, ForeignKey("users.id"), nullable=True)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
@@ -0,0 +1,143 @@
+"""
+Paginación por cursor (keyset) y conteos en caché para los listados.
+Los datos auxiliares de los listados (cursos, filtros guardados) usan la misma caché.
+Con keyset la página 200 cuesta lo mismo que la primera: se busca a partir
+del último registro visto en vez de saltar N filas con OFFSET.
+"""
+import os
+import re
+import time
+import threading
+from itertools import chain
+from sqlalchemy import event, select, or_, and_
+from sqlalchemy.orm import Session
+
+# --- CONFIGURACIÓN ---
+# Los conteos se invalidan al escribir, pero solo en el worker que escribió:
+# los demás pueden mostrar un total viejo hasta por este tiempo.
+COUNT_CACHE_TTL = int(os.getenv("COUNT_CACHE_TTL", "30"))
+MIN_FULLTEXT_WORD = 3   # innodb_ft_min_token_size por defecto
+
+_counts = {}   # (tabla, clave) -> (expira, valor)
+_counts_lock = threading.Lock()
+
+# --- CONTEOS ---
+
+def cached(table: str, key: str, load):
+    """Resultado de load(), recordado hasta que la tabla cambie (o venza el TTL)."""
+    now = time.monotonic()
+    entry = _counts.get((table, key))
+    if entry and entry[0] > now:
+        return entry[1]
+    value = load()
+    with _counts_lock:
+        _counts[(table, key)] = (now + COUNT_CACHE_TTL, value)
+    return value
+
+def cached_count(table: str, key: str, query) -> int:
+    """Total de registros de un listado, recordado hasta que la tabla cambie."""
+    return cached(table, f"count:{key}", lambda: query.order_by(None).count())
+
+def invalidate_counts(*tables: str):
+    with _counts_lock:
+        for key in [k for k in _counts if k[0] in tables]:
+            del _counts[key]
+
+@event.listens_for(Session, "after_flush")
+def _invalidate_on_flush(session, flush_context):
+    # En after_flush las listas new/dirty/deleted aún muestran lo que se escribió
+    tables = {
+        getattr(obj, "__tablename__", None)
+        for obj in chain(session.new, session.dirty, session.deleted)
+    }
+    tables.discard(None)
+    if tables:
+        invalidate_counts(*tables)
+
+@event.listens_for(Session, "do_orm_execute")
+def _invalidate_on_bulk(orm_execute_state):
+    # UPDATE/DELETE masivos (session.execute(update(...)) o query.update())
+    if orm_execute_state.is_update or orm_execute_state.is_delete:
+        mapper = orm_execute_state.bind_mapper
+        if mapper is not None:
+            invalidate_counts(mapper.local_table.name)
+
+# --- BÚSQUEDA ---
+
+def search_filter(db: Session, q: str, name_col, id_col):
+    """
+    Filtro de búsqueda que aprovecha índices:
+    - Si el texto tiene dígitos se busca como prefijo del ID (índice único).
+    - Si no, búsqueda FULLTEXT por palabras del nombre (MySQL).
+    En otros motores (pruebas locales) se usa LIKE.
+    """
+    q = q.strip()
+    if any(ch.isdigit() for ch in q):
+        return id_col.like(f"{q}%")
+
+    if db.get_bind().dialect.name == "mysql":
+        # Quitar operadores del modo booleano y exigir cada palabra como prefijo
+        words = [w for w in re.sub(r'[+\-<>()~*"@]', " ", q).split() if len(w) >= MIN_FULLTEXT_WORD]
+        if words:
+            return name_col.match(" ".join(f"+{w}*" for w in words))
+        return name_col.like(f"{q}%")
+
+    return or_(name_col.ilike(f"%{q}%"), id_col.ilike(f"%{q}%"))
+
+# --- KEYSET ---
+
+def _after(sort_col, id_col, value, row_id, descending: bool):
+    """Condición 'viene después de (value, row_id)' en el orden del listado."""
+    if descending:
+        return or_(sort_col < value, and_(sort_col == value, id_col < row_id))
+    return or_(sort_col > value, and_(sort_col == value, id_col > row_id))
+
+def keyset_paginate(db: Session, query, sort_col, id_col, limit: int,
+                    after: int = None, before: int = None, last: bool = False,
+                    descending: bool = False, total: int = None):
+    """
+    Página de resultados ordenada por (sort_col, id_col).
+    after:  id del último registro de la página anterior (ir a la siguiente)
+    before: id del primer registro de la página siguiente (volver a la anterior)
+    last:   ir directamente a la última página
+    total:  total de registros (con last): la última página trae solo el resto,
+            así al volver atrás las páginas quedan alineadas con su número
+    Retorna (items, nav) donde nav tiene has_next, has_prev, first_id, last_id.
+    """
+    if last and not after and total:
+        limit = total % limit or limit
+    cursor_id = after or before
+    # El valor de orden del cursor se resuelve dentro de la misma consulta
+    cursor_value = select(sort_col).where(id_col == cursor_id).correlate(None).scalar_subquery() if cursor_id else None
+
+    # Al ir hacia atrás (before / last) se consulta en orden inverso y luego se voltea
+    backwards = bool(before) or (last and not after)
+    order_desc = descending != backwards
+    order = [sort_col.desc(), id_col.desc()] if order_desc else [sort_col.asc(), id_col.asc()]
+
+    base_query = query
+    if after:
+        query = query.filter(_after(sort_col, id_col, cursor_value, after, descending))
+    elif before:
+        query = query.filter(_after(sort_col, id_col, cursor_value, before, not descending))
+
+    items = query.order_by(*order).limit(limit + 1).all()
+    if not items and cursor_id:
+        # El registro del cursor ya no existe: volver a la primera página
+        return keyset_paginate(db, base_query, sort_col, id_col, limit, descending=descending)
+    has_more = len(items) > limit
+    items = items[:limit]
+    if backwards:
+        items.reverse()
+
+    if backwards:
+        has_next, has_prev = bool(before), has_more
+    else:
+        has_next, has_prev = has_more, bool(after)
+
+    return items, {
+        "has_next": has_next,
+        "has_prev": has_prev,
+        "first_id": items[0].id if items else None,
+        "last_id": items[-1].id if items else None,
+    }
@@ -0,0 +1,310 @@
+"""
+Procesamiento de fotografías.
+Normaliza las fotos subidas (rotación EXIF, recorte cuadrado, tamaño reducido)
+y mantiene variantes de tamaño fijo (WebP/JPEG) para las pantallas del escáner.
+"""
+import os
+import hashlib
+import shutil
+import zipfile
+import threading
+import time
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from typing import TYPE_CHECKING
+from . import lanes
+
+# PIL se importa al procesar fotos, no al cargar el módulo: los workers que solo
+# sirven el escáner (variant_url con la variante ya generada) no la necesitan.
+if TYPE_CHECKING:
+    from PIL import Image
+
+# --- CONFIGURACIÓN ---
+PHOTOS_DIR = "app/static/photos"
+VARIANTS_DIR = os.path.join(PHOTOS_DIR, "variants")
+PHOTOS_URL = "/static/photos"
+CARD_SIZE = 600         # Foto normalizada (px), suficiente para 30mm a 500dpi
+VARIANT_SIZES = (128, 256, 600)
+# webp (más liviano) o jpeg (navegadores antiguos)
+VARIANT_FORMAT = os.getenv("PHOTO_VARIANT_FORMAT", "webp").lower()
+VARIANT_EXT = "jpg" if VARIANT_FORMAT in ("jpg", "jpeg") else "webp"
+JPEG_QUALITY = 85
+WEBP_QUALITY = 80
+VALID_EXTENSIONS = (".jpg", ".jpeg", ".png")
+# Procesos para normalizar fotos (0 = lanes.BULK_PROCESSES)
+PHOTO_WORKERS = int(os.getenv("PHOTO_WORKERS", "0")) or lanes.BULK_PROCESSES
+# Fotos para impresión de carnets: reducidas a la resolución real de la impresora
+PRINT_DPI = int(os.getenv("CARD_PRINT_DPI", "300"))
+PRINT_JPEG_QUALITY = int(os.getenv("CARD_PRINT_JPEG_QUALITY", "85"))
+PRINT_CACHE_DIR = os.getenv("CARD_PHOTO_CACHE_DIR", "cache/card_photos")
+# Segundos que una variante verificada se sirve desde memoria sin revisar el disco.
+# Las subidas en este worker la invalidan al instante; en los demás, a más tardar en este tiempo.
+VARIANT_INDEX_TTL = int(os.getenv("PHOTO_VARIANT_INDEX_TTL", "60"))
+
+for _size in VARIANT_SIZES:
+    os.makedirs(os.path.join(VARIANTS_DIR, str(_size)), exist_ok=True)
+
+# Memoria de variantes ya verificadas: (photo_path, tamaño) -> (verificada_en, url)
+_variant_index = {}
+# Variantes que faltaban al mostrarse: se generan en un hilo aparte, nunca en la petición
+_variant_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="photo-variants")
+_variant_pending = set()
+_variant_lock = threading.Lock()
+
+# --- UTILIDADES ---
+
+def square_crop_box(width: int, height: int):
+    """
+    Caja de recorte cuadrado orientada al rostro.
+    En fotos verticales (retrato) la cara suele estar en el tercio superior,
+    así que el recorte se desplaza hacia arriba en lugar de centrarse.
+    """
+    side = min(width, height)
+    left = (width - side) // 2
+    top = int((height - side) * 0.25) if height > width else (height - side) // 2
+    return (left, top, left + side, top + side)
+
+def resolve_photo_path(photo_path: str):
+    """Convierte la ruta guardada en BD (/static/photos/x.jpg) en ruta de disco, si existe."""
+    if not photo_path:
+        return None
+    for candidate in (f"app{photo_path}", photo_path.lstrip("/")):
+        if os.path.exists(candidate):
+            return candidate
+    return None
+
+def _variant_file(src_path: str, size: int) -> str:
+    # Por hash de la ruta completa: dos fotos con el mismo nombre en carpetas distintas no se pisan
+    key = hashlib.sha1(os.path.abspath(src_path).encode("utf-8")).hexdigest()[:20]
+    return os.path.join(VARIANTS_DIR, str(size), f"{key}.{VARIANT_EXT}")
+
+def _save_variant(img: "Image.Image", target: str, size: int):
+    from PIL import Image
+    variant = img.resize((size, size), Image.Resampling.LANCZOS) if img.width > size else img
+    # Escritura atómica: otro hilo puede estar sirviendo el archivo anterior
+    tmp_target = f"{target}.{os.getpid()}.{threading.get_ident()}.tmp"
+    if VARIANT_EXT == "webp":
+        variant.save(tmp_target, "WEBP", quality=WEBP_QUALITY, method=4)
+    else:
+        variant.save(tmp_target, "JPEG", quality=JPEG_QUALITY, optimize=True)
+    os.replace(tmp_target, target)
+
+def _load_square(src_path: str, max_side: int) -> "Image.Image":
+    from PIL import Image, ImageOps
+    with Image.open(src_path) as img:
+        # Reducción rápida en la decodificación (JPEG) antes de trabajar
+        img.draft("RGB", (max_side * 2, max_side * 2))
+        img = ImageOps.exif_transpose(img).convert("RGB")
+    return img.crop(square_crop_box(*img.size))
+
+def build_variants(src_path: str, sizes=VARIANT_SIZES, img: "Image.Image" = None):
+    """Genera las variantes de tamaño fijo de una foto."""
+    from PIL import Image
+    if img is None:
+        img = _load_square(src_path, max(sizes))
+    # De mayor a menor: cada reducción parte de la anterior
+    for size in sorted(sizes, reverse=True):
+        _save_variant(img, _variant_file(src_path, size), size)
+        if img.width > size:
+            img = img.resize((size, size), Image.Resampling.LANCZOS)
+
+def forget_variants(photo_path: str):
+    """Olvida las variantes en memoria de una foto (se revisará el disco en el próximo escaneo)."""
+    for size in VARIANT_SIZES:
+        _variant_index.pop((photo_path, size), None)
+
+def refresh_variants(photo_path: str) -> bool:
+    """
+    Genera (o regenera) las variantes de una foto recién guardada.
+    Se llama al subir la foto (crear/editar); las importaciones ZIP las generan en normalize_photo.
+    """
+    forget_variants(photo_path)
+    src_path = resolve_photo_path(photo_path)
+    if not src_path:
+        return False
+    try:
+        build_variants(src_path)
+    except Exception as e:
+        print(f"Error generando variantes {photo_path}: {e}")
+        return False
+    return True
+
+def _build_in_background(src_path: str):
+    with _variant_lock:
+        if src_path in _variant_pending:
+            return
+        _variant_pending.add(src_path)
+
+    def task():
+        try:
+            build_variants(src_path)
+        except Exception as e:
+            print(f"Error generando variantes {src_path}: {e}")
+        finally:
+            with _variant_lock:
+                _variant_pending.discard(src_path)
+
+    _variant_executor.submit(task)
+
+def _variant_size(min_size: int) -> int:
+    return next((s for s in VARIANT_SIZES if s >= min_size), VARIANT_SIZES[-1])
+
+def _current_variant_url(src_path: str, size: int):
+    """URL versionada de la variante si existe y está al día; None si falta o es vieja."""
+    src_mtime = int(os.path.getmtime(src_path))
+    target = _variant_file(src_path, size)
+    if not os.path.exists(target) or os.path.getmtime(target) < src_mtime:
+        return None
+    return f"{PHOTOS_URL}/variants/{size}/{os.path.basename(target)}?v={src_mtime}"
+
+def variant_url(photo_path: str, min_size: int = VARIANT_SIZES[0]):
+    """
+    URL de la variante más pequeña que cubre min_size px.
+    Las variantes verificadas se sirven desde memoria (sin tocar el disco) hasta
+    VARIANT_INDEX_TTL segundos. Si la variante no existe o es más vieja que la
+    foto, se devuelve la foto original y la variante se genera en segundo plano
+    (el escaneo no espera a PIL).
+    La URL lleva la versión (mtime) para que el navegador no muestre una foto vieja.
+    """
+    if not photo_path:
+        return photo_path
+    size = _variant_size(min_size)
+    key = (photo_path, size)
+    cached = _variant_index.get(key)
+    if cached and time.monotonic() - cached[0] < VARIANT_INDEX_TTL:
+        return cached[1]
+
+    src_path = resolve_photo_path(photo_path)
+    if not src_path:
+        return photo_path
+    try:
+        url = _current_variant_url(src_path, size)
+    except OSError as e:
+        print(f"Error buscando variante {photo_path}: {e}")
+        return photo_path
+    if url is None:
+        _variant_index.pop(key, None)
+        _build_in_background(src_path)
+        return photo_path
+    _variant_index[key] = (time.monotonic(), url)
+    return url
+
+def warm_variant_index(photo_paths, min_size: int = VARIANT_SIZES[0]) -> int:
+    """
+    Carga en memoria las variantes que ya existen y están al día (arranque del worker):
+    durante VARIANT_INDEX_TTL segundos los escaneos no revisan el disco; después
+    cada foto se revalida con un stat al escanearse. No genera variantes.
+    """
+    size = _variant_size(min_size)
+    now = time.monotonic()
+    count = 0
+    for photo_path in photo_paths:
+        src_path = resolve_photo_path(photo_path)
+        if not src_path:
+            continue
+        try:
+            url = _current_variant_url(src_path, size)
+        except OSError:
+            continue
+        if url:
+            _variant_index[(photo_path, size)] = (now, url)
+            count += 1
+    return count
+
+def normalize_photo(src_path: str, key: str):
+    """
+    Decodifica una foto, aplica la rotación EXIF, recorta al cuadrado y
+    escribe la foto normalizada (JPEG) junto con sus variantes.
+    Retorna (key, nombre_archivo) o (key, None) si la imagen no es válida.
+    Se ejecuta dentro del pool de procesos, por eso solo recibe datos simples.
+    """
+    from PIL import Image
+    try:
+        img = _load_square(src_path, CARD_SIZE)
+        filename = f"{key}.jpg"
+        target = os.path.join(PHOTOS_DIR, filename)
+        card = img.resize((CARD_SIZE, CARD_SIZE), Image.Resampling.LANCZOS) if img.width > CARD_SIZE else img
+        card.save(target, "JPEG", quality=JPEG_QUALITY, optimize=True)
+        build_variants(target, img=card)
+        return key, filename
+    except Exception as e:
+        print(f"Error procesando foto {key}: {e}")
+        return key, None
+
+def print_photo(src_path: str, size_pt: float):
+    """
+    Versión para imprimir de una foto: cuadrada, a PRINT_DPI para el tamaño
+    impreso (en puntos PDF) y en JPEG. Se guarda en caché por (ruta, mtime,
+    px), así un lote repetido no vuelve a decodificar las fotos originales.
+    Retorna la ruta del JPEG o la original si no se pudo preparar.
+    """
+    from PIL import Image
+    px = max(1, round(size_pt / 72 * PRINT_DPI))
+    try:
+        src_mtime = os.path.getmtime(src_path)
+        raw = f"{os.path.abspath(src_path)}|{src_mtime}|{px}|{PRINT_JPEG_QUALITY}"
+        key = hashlib.sha1(raw.encode("utf-8")).hexdigest()
+        target = os.path.join(PRINT_CACHE_DIR, key[:2], f"{key}.jpg")
+        if os.path.exists(target):
+            return target
+
+        img = _load_square(src_path, px)
+        if img.width > px:
+            img = img.resize((px, px), Image.Resampling.LANCZOS)
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        tmp_target = f"{target}.{os.getpid()}.{threading.get_ident()}.tmp"
+        img.save(tmp_target, "JPEG", quality=PRINT_JPEG_QUALITY, optimize=True)
+        os.replace(tmp_target, target)
+        return target
+    except Exception as e:
+        print(f"Error preparando foto para impresión {src_path}: {e}")
+        return src_path
+
+def _normalize_task(task):
+    return normalize_photo(*task)
+
+def normalize_batch(tasks, progress=None):
+    """
+    Normaliza muchas fotos en paralelo.
+    tasks: lista de (ruta_origen, key). Retorna {key: nombre_archivo | None}
+    progress: callback opcional progress(key, nombre_archivo) por cada foto terminada.
+    """
+    results = {}
+    if not tasks:
+        return results
+    # 'spawn' evita heredar hilos y conexiones del worker web
+    ctx = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=PHOTO_WORKERS, mp_context=ctx) as pool:
+        for key, filename in pool.map(_normalize_task, tasks, chunksize=8):
+            results[key] = filename
+            if progress:
+                progress(key, filename)
+    return results
+
+def extract_zip_photos(fileobj, target_dir: str):
+    """
+    Extrae al disco las fotos de un ZIP, miembro a miembro (sin cargar el ZIP
+    completo en memoria). El nombre del archivo es el ID de la persona.
+    Retorna {id: ruta_extraida}
+    """
+    extracted = {}
+    with zipfile.ZipFile(fileobj, "r") as zip_ref:
+        for info in zip_ref.infolist():
+            # Ignorar carpetas o archivos ocultos (__MACOSX, etc)
+            if info.is_dir() or info.filename.startswith("__"):
+                continue
+
+            # Ejemplo: "fotos/1001.jpg" -> ("1001", ".jpg")
+            person_id, ext = os.path.splitext(os.path.basename(info.filename))
+            ext = ext.lower()
+            if not person_id or person_id.startswith(".") or ext not in VALID_EXTENSIONS:
+                continue
+
+            target_path = os.path.join(target_dir, f"{person_id}{ext}")
+            with zip_ref.open(info) as src, open(target_path, "wb") as dst:
+                shutil.copyfileobj(src, dst)
+            extracted[person_id] = target_path
+    return extracted
+
+def photo_url(filename: str) -> str:
+    return f"{PHOTOS_URL}/{filename}"
@@ -0,0 +1,139 @@
+"""
+Generación de códigos QR con caché.
+El payload firmado (auth.sign_qr_content) solo cambia si cambia el ID o el secreto,
+así que la imagen se guarda en disco por hash(payload, parámetros de render)
+y las más usadas se mantienen en memoria (LRU).
+SVG y EPS se arman directamente desde la matriz de módulos, sin pasar por PIL.
+"""
+import os
+import io
+import hashlib
+from functools import lru_cache
+
+# --- CONFIGURACIÓN ---
+QR_CACHE_DIR = os.getenv("QR_CACHE_DIR", "cache/qr")
+QR_MEMORY_ITEMS = int(os.getenv("QR_MEMORY_ITEMS", "1024"))
+RENDER_VERSION = "2"  # Cambiar si cambia la forma de dibujar (invalida la caché)
+# Nivel de corrección de errores: L (7%), M (15%), Q (25%), H (30%).
+# Valores de qrcode.constants.ERROR_CORRECT_*, sin importar qrcode (y PIL) al cargar.
+ERROR_CORRECTION = {
+    "L": 1,
+    "M": 0,
+    "Q": 3,
+    "H": 2,
+}[os.getenv("QR_ERROR_CORRECTION", "M").upper()]
+
+os.makedirs(QR_CACHE_DIR, exist_ok=True)
+
+def _make(data: str, border: int = 0):
+    import qrcode
+    qr = qrcode.QRCode(version=None, error_correction=ERROR_CORRECTION, border=border)
+    qr.add_data(data)
+    qr.make(fit=True)
+    return qr
+
+@lru_cache(maxsize=QR_MEMORY_ITEMS)
+def qr_matrix(data: str, border: int = 0):
+    """Matriz de módulos (tupla de filas de bool, True = negro)."""
+    return tuple(tuple(row) for row in _make(data, border).get_matrix())
+
+def dark_runs(matrix):
+    """Tramos horizontales de módulos negros: (fila, columna, largo)."""
+    for y, row in enumerate(matrix):
+        x = 0
+        size = len(row)
+        while x < size:
+            if row[x]:
+                start = x
+                while x < size and row[x]:
+                    x += 1
+                yield y, start, x - start
+            else:
+                x += 1
+
+def render_qr(data: str, box_size: int = 10, border: int = 0):
+    """
+    Imagen PIL del QR (sin caché).
+    Se usa la versión (tamaño de matriz) más pequeña en la que cabe el contenido:
+    menos módulos = módulos más grandes en el carnet = lectura más rápida.
+    """
+    import qrcode
+    qr = qrcode.QRCode(version=None, error_correction=ERROR_CORRECTION, box_size=box_size, border=border)
+    qr.add_data(data)
+    qr.make(fit=True)
+    return qr.make_image(fill_color="black", back_color="white")
+
+def cache_key(data: str, box_size: int, border: int, fmt: str = "png") -> str:
+    raw = f"{RENDER_VERSION}|{ERROR_CORRECTION}|{fmt}|{box_size}|{border}|{data}"
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+def _cache_path(key: str, fmt: str) -> str:
+    # Subcarpeta por prefijo para no tener miles de archivos en un solo directorio
+    return os.path.join(QR_CACHE_DIR, key[:2], f"{key}.{fmt}")
+
+def _write_atomic(path: str, content: bytes):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(content)
+    os.replace(tmp_path, path)
+
+@lru_cache(maxsize=QR_MEMORY_ITEMS)
+def qr_svg(data: str, box_size: int = 10, border: int = 0) -> bytes:
+    """
+    SVG del QR: un solo <path> con una línea de 1 módulo de grosor por cada
+    tramo de módulos negros (más corto que dibujar rectángulos).
+    """
+    matrix = qr_matrix(data, border)
+    size = len(matrix)
+    path = "".join(f"M{x} {y}h{n}" for y, x, n in dark_runs(matrix))
+    svg = (
+        f'<svg xmlns="http://www.w3.org/2000/svg" viewBox="0 0 {size} {size}" '
+        f'width="{size * box_size}" height="{size * box_size}" shape-rendering="crispEdges">'
+        f'<rect width="{size}" height="{size}" fill="#fff"/>'
+        f'<path transform="translate(0 .5)" stroke="#000" stroke-width="1" d="{path}"/></svg>'
+    )
+    return svg.encode("ascii")
+
+@lru_cache(maxsize=QR_MEMORY_ITEMS)
+def qr_eps(data: str, box_size: int = 10, border: int = 0) -> bytes:
+    """EPS del QR (PostScript: el origen está abajo, se invierten las filas)."""
+    matrix = qr_matrix(data, border)
+    size = len(matrix)
+    side = size * box_size
+    lines = [
+        "%!PS-Adobe-3.0 EPSF-3.0",
+        f"%%BoundingBox: 0 0 {side} {side}",
+        "%%EndComments",
+        f"{box_size} {box_size} scale",
+        "1 setgray 0 0 moveto", f"0 0 {size} {size} rectfill",
+        "0 setgray",
+        "/r { 1 rectfill } bind def",
+    ]
+    lines += [f"{x} {size - 1 - y} {n} r" for y, x, n in dark_runs(matrix)]
+    lines += ["showpage", "%%EOF", ""]
+    return "\n".join(lines).encode("ascii")
+
+@lru_cache(maxsize=QR_MEMORY_ITEMS)
+def qr_png(data: str, box_size: int = 10, border: int = 0) -> bytes:
+    """PNG del QR: memoria -> disco -> generación."""
+    path = _cache_path(cache_key(data, box_size, border), "png")
+    try:
+        with open(path, "rb") as f:
+            return f.read()
+    except FileNotFoundError:
+        pass
+
+    img = render_qr(data, box_size, border)
+    buffer = io.BytesIO()
+    img.save(buffer, format="PNG")
+    content = buffer.getvalue()
+    _write_atomic(path, content)
+    return content
+
+# Formatos de descarga: función, tipo MIME
+FORMATS = {
+    "png": (qr_png, "image/png"),
+    "svg": (qr_svg, "image/svg+xml"),
+    "eps": (qr_eps, "application/postscript"),
+}
@@ -1,36 +1,48 @@
 from fastapi import APIRouter, Depends, HTTPException, status, Request, Form
 from fastapi.responses import HTMLResponse, RedirectResponse
-from fastapi.templating import Jinja2Templates
 from sqlalchemy.orm import Session
 from datetime import timedelta
-from .. import database, models, auth
+from .. import database, models, auth, lanes
+from ..templating import templates
 
 
 router = APIRouter(tags=["Authentication"])
-templates = Jinja2Templates(directory="app/templates")
 
 @router.get("/", response_class=HTMLResponse)
 def login_page(request: Request):
     return templates.TemplateResponse("login.html", {"request": request})
 
 @router.post("/login")
-def login(
+async def login(
     request: Request,
     username: str = Form(...),
     password: str = Form(...),
     db: Session = Depends(database.get_db)
 ):
-    user = db.query(models.User).filter(models.User.username == username).first()
-    
-    if not user or not auth.verify_password(password, user.hashed_password):
+    # Bloqueo temporal tras varios intentos fallidos (se revisa antes de gastar CPU).
+    # Detrás de Nginx, uvicorn toma la IP real de X-Forwarded-For.
+    client_ip = request.client.host if request.client else ""
+    locked_for = auth.login_locked_for(client_ip, username)
+    if locked_for:
+        minutes = (locked_for + 59) // 60
+        return templates.TemplateResponse("login.html", {
+            "request": request,
+            "error": f"Demasiados intentos fallidos. Intente de nuevo en {minutes} min."
+        }, status_code=status.HTTP_429_TOO_MANY_REQUESTS)
+
+    # PBKDF2 es lento a propósito: se verifica en el carril "login", fuera del event loop
+    user = await lanes.run_in("login", _authenticate, db, username, password)
+    if not user:
+        auth.record_login_failure(client_ip, username)
         return templates.TemplateResponse("login.html", {
             "request": request, 
             "error": "Usuario o contraseña incorrectos"
         })
-    
+    auth.reset_login_failures(client_ip, username)
+
     access_token_expires = timedelta(minutes=auth.ACCESS_TOKEN_EXPIRE_MINUTES)
     access_token = auth.create_access_token(
-        data={"sub": user.username, "role": user.role},
+        data={"sub": user["username"], "role": user["role"]},
         expires_delta=access_token_expires
     )
     
@@ -46,6 +58,23 @@ def login(
     )
     return response
 
+def _authenticate(db: Session, username: str, password: str):
+    """Devuelve {username, role} si las credenciales son válidas, o None."""
+    user = db.query(models.User).filter(models.User.username == username).first()
+    if not user:
+        auth.dummy_verify()
+        return None
+
+    valid, new_hash = auth.verify_and_update(password, user.hashed_password)
+    if not valid:
+        return None
+    identity = {"username": user.username, "role": user.role}
+    if new_hash:
+        # Cambiaron las iteraciones (PASSWORD_ROUNDS): se guarda el hash recalculado
+        user.hashed_password = new_hash
+        db.commit()
+    return identity
+
 @router.get("/logout")
 def logout():
     response = RedirectResponse(url="/", status_code=status.HTTP_302_FOUND)
@@ -1,16 +1,22 @@
-from fastapi import APIRouter, Depends, HTTPException
-from fastapi.responses import Response
+from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi.responses import Response, RedirectResponse, FileResponse, StreamingResponse
+from sqlalchemy import update, bindparam
 from sqlalchemy.orm import Session
-from reportlab.pdfgen import canvas
-from reportlab.lib.units import mm
-from reportlab.lib.utils import ImageReader
-from reportlab.pdfbase.pdfmetrics import stringWidth
-import qrcode
+from starlette.requests import Request
+from datetime import datetime
+from typing import Optional
 import io
 import os
+import time
 import zipfile
-import math
-from .. import database, models, deps, auth
+from .. import database, models, deps, qr, jobs, card_render, lanes
+from ..card_render import CARD_WIDTH, CARD_HEIGHT, draw_card
+
+# --- CONFIGURACIÓN ---
+CARD_BATCH_DIR = os.getenv("CARD_BATCH_DIR", "cache/batches")
+BATCH_MAX_AGE = 24 * 3600   # Los PDF de lotes se borran después de un día
+
+os.makedirs(CARD_BATCH_DIR, exist_ok=True)
 
 router = APIRouter(
     prefix="/cards",
@@ -18,138 +24,12 @@ router = APIRouter(
     dependencies=[Depends(deps.require_admin)]
 )
 
-# --- CONFIGURACIÓN ---
-CARD_WIDTH = 54 * mm
-CARD_HEIGHT = 85 * mm
-ASSETS_DIR = "app/static/assets"
-BG_PATH = os.path.join(ASSETS_DIR, "carnet_bg.png")
-AVATAR_PATH = os.path.join(ASSETS_DIR, "avatar.png")
-TEXT_MARGIN = 4 * mm
-MAX_TEXT_WIDTH = CARD_WIDTH - (2 * TEXT_MARGIN)
-
-# --- UTILIDADES ---
-
-def generate_qr_image(data: str):
-    qr = qrcode.QRCode(version=1, box_size=10, border=0)
-    qr.add_data(data)
-    qr.make(fit=True)
-    return qr.make_image(fill_color="black", back_color="white")
-
-def split_text_balanced(text):
-    words = text.split()
-    if len(words) <= 1: return text, ""
-    mid = math.ceil(len(words) / 2)
-    return " ".join(words[:mid]), " ".join(words[mid:])
-
-def draw_card(c: canvas.Canvas, person, is_employee=False):
-    """
-    Dibuja un carnet genérico.
-    person: puede ser modelo Student o Employee
-    """
-    # 1. Fondo
-    if os.path.exists(BG_PATH):
-        c.drawImage(BG_PATH, 0, 0, width=CARD_WIDTH, height=CARD_HEIGHT)
-    else:
-        c.setFillColorRGB(1, 1, 1)
-        c.rect(0, 0, CARD_WIDTH, CARD_HEIGHT, fill=1, stroke=1)
-
-    # 2. Foto (Circular)
-    photo_size = 30 * mm
-    photo_y = 43 * mm
-    photo_x = (CARD_WIDTH - photo_size) / 2
-    radius = photo_size / 2
-    # LÓGICA DE SELECCIÓN DE IMAGEN
-    image_to_draw = None
-
-    # 1. Intentar buscar foto personal
-    if person.photo_path:
-        sys_path = person.photo_path.lstrip("/")
-        if os.path.exists(f"app{person.photo_path}"):
-            image_to_draw = f"app{person.photo_path}"
-        elif os.path.exists(sys_path):
-            image_to_draw = sys_path
-    
-    # 2. Si no se encontró foto personal, usar Avatar Genérico
-    if not image_to_draw and os.path.exists(AVATAR_PATH):
-        image_to_draw = AVATAR_PATH
-    
-    c.saveState()
-    path = c.beginPath()
-    path.circle(photo_x + radius, photo_y + radius, radius) 
-    c.clipPath(path, stroke=0, fill=0)
-    
-    if image_to_draw:
-        try:
-            c.drawImage(image_to_draw, photo_x, photo_y, width=photo_size, height=photo_size, mask=None) 
-        except:
-            c.setFillColorRGB(0.9, 0.9, 0.9)
-            c.rect(photo_x, photo_y, photo_size, photo_size, fill=1)
-    else:
-        c.setFillColorRGB(0.9, 0.9, 0.9)
-        c.rect(photo_x, photo_y, photo_size, photo_size, fill=1)
-    c.restoreState()
-    
-    # Borde foto
-    c.setStrokeColorRGB(0.2, 0.2, 0.2)
-    c.setLineWidth(0.5)
-    c.circle(photo_x + radius, photo_y + radius, radius, stroke=1, fill=0)
-
-    # 3. Nombre
-    c.setFillColorRGB(0, 0, 0)
-    name_y = 36 * mm
-    full_name = person.full_name.upper()
-    font_name = "Helvetica-Bold"
-    font_size = 12
-    
-    if stringWidth(full_name, font_name, font_size) > MAX_TEXT_WIDTH:
-        font_size = 10
-        if stringWidth(full_name, font_name, font_size) > MAX_TEXT_WIDTH:
-            l1, l2 = split_text_balanced(full_name)
-            c.setFont(font_name, 11)
-            c.drawCentredString(CARD_WIDTH/2, name_y + 2*mm, l1)
-            c.drawCentredString(CARD_WIDTH/2, name_y - 2*mm, l2)
-        else:
-            c.setFont(font_name, font_size)
-            c.drawCentredString(CARD_WIDTH/2, name_y, full_name)
-    else:
-        c.setFont(font_name, font_size)
-        c.drawCentredString(CARD_WIDTH/2, name_y, full_name)
-
-    # 4. Datos Variables (Estudiante vs Empleado)
-    c.setFont("Helvetica", 10)
-    info_y = 30 * mm
-    
-    if is_employee:
-        # EMPLEADO
-        #if person.position:
-        #    c.drawCentredString(CARD_WIDTH/2, info_y + 4*mm, person.position.upper())
-        c.setFont("Helvetica", 9)
-        c.drawCentredString(CARD_WIDTH/2, info_y, f"C.C.: {person.doc_id}")
-        qr_data = person.doc_id
-    else:
-        # ESTUDIANTE
-        # Curso omitido según diseño anterior, o se puede poner si se desea
-        # c.drawCentredString(CARD_WIDTH/2, info_y + 4*mm, person.course) 
-        c.setFont("Helvetica", 9)
-        c.drawCentredString(CARD_WIDTH/2, info_y, f"ID: {person.student_id}")
-        qr_data = person.student_id
-
-    # 5. QR Firmado
-    secure_qr = auth.sign_qr_content(qr_data)
-    qr_img = generate_qr_image(secure_qr)
-    
-    qr_size = 26 * mm
-    qr_x = (CARD_WIDTH - qr_size) / 2
-    
-    side_im_data = io.BytesIO()
-    qr_img.save(side_im_data, format='PNG')
-    side_im_data.seek(0)
-    c.drawImage(ImageReader(side_im_data), qr_x, 3*mm, width=qr_size, height=qr_size)
-
 # --- ENDPOINTS ---
 
 @router.get("/pdf/{student_id}")
-def download_student_card(student_id: str, db: Session = Depends(database.get_db)):
+@lanes.bulk
+def download_student_card(student_id: str, db: Session = Depends(database.get_bulk_db)):
+    from reportlab.pdfgen import canvas
     student = db.query(models.Student).filter(models.Student.student_id == student_id).first()
     if not student: raise HTTPException(404, "No encontrado")
     
@@ -163,7 +43,9 @@ def download_student_card(student_id: str, db: Session = Depends(database.get_db
 
 # NUEVO: Endpoint para Empleado
 @router.get("/employee/pdf/{doc_id}")
-def download_employee_card(doc_id: str, db: Session = Depends(database.get_db)):
+@lanes.bulk
+def download_employee_card(doc_id: str, db: Session = Depends(database.get_bulk_db)):
+    from reportlab.pdfgen import canvas
     emp = db.query(models.Employee).filter(models.Employee.doc_id == doc_id).first()
     if not emp: raise HTTPException(404, "Empleado no encontrado")
     
@@ -175,27 +57,256 @@ def download_employee_card(doc_id: str, db: Session = Depends(database.get_db)):
     buffer.seek(0)
     return Response(content=buffer.getvalue(), headers={'Content-Disposition': f'attachment; filename="carnet_EMP_{doc_id}.pdf"'}, media_type='application/pdf')
 
+def _batch_path(job_id: str) -> str:
+    return os.path.join(CARD_BATCH_DIR, f"{job_id}.pdf")
+
+def _cleanup_batches():
+    limit = time.time() - BATCH_MAX_AGE
+    for name in os.listdir(CARD_BATCH_DIR):
+        path = os.path.join(CARD_BATCH_DIR, name)
+        try:
+            if os.path.getmtime(path) < limit:
+                os.remove(path)
+        except OSError:
+            pass
+
+# Fuentes de carnets: estudiantes y empleados comparten el mismo flujo de lotes
+CARD_SOURCES = {
+    "students": {
+        "model": models.Student,
+        "key": models.Student.student_id,
+        "group": models.Student.course,      # Filtro por curso
+        "is_employee": False,
+        "back_url": "/students",
+        "label": "estudiantes",
+    },
+    "employees": {
+        "model": models.Employee,
+        "key": models.Employee.doc_id,
+        "group": models.Employee.position,   # Filtro por cargo
+        "is_employee": True,
+        "back_url": "/employees",
+        "label": "empleados",
+    },
+}
+
+def _parse_ids(ids: Optional[str]) -> list:
+    return [i.strip() for i in (ids or "").replace("\n", ",").split(",") if i.strip()]
+
+def _filters_label(group, ids, changed_since, only_changed) -> str:
+    parts = []
+    if group: parts.append(f"grupo={group}")
+    if ids: parts.append(f"ids={len(ids)}")
+    if changed_since: parts.append(f"desde={changed_since:%Y-%m-%d}")
+    if only_changed: parts.append("solo cambios")
+    return ", ".join(parts) or "todos"
+
+def _select_people(db: Session, kind: str, group, ids: list, changed_since: datetime):
+    source = CARD_SOURCES[kind]
+    model = source["model"]
+    query = db.query(model)
+    if group:
+        query = query.filter(source["group"] == group)
+    if ids:
+        query = query.filter(source["key"].in_(ids))
+    if changed_since:
+        query = query.filter(model.updated_at >= changed_since)
+    return query.order_by(source["group"], model.full_name).all()
+
+def _snapshots(people, is_employee: bool, only_changed: bool) -> list:
+    # Los procesos del pool reciben copias livianas con el QR ya firmado
+    cards = [card_render.card_snapshot(p, is_employee) for p in people]
+    if only_changed:
+        # Solo los que nunca se imprimieron o cuyo nombre/ID/foto/llave QR cambió desde el último lote
+        printed = {p.id: p.card_fingerprint for p in people}
+        cards = [card for card in cards if printed[card["id"]] != card["fingerprint"]]
+    return cards
+
+def _record_print_run(db: Session, kind: str, cards: list, filters: str, only_changed: bool,
+                      job_id: str = None, user_id: int = None):
+    """Registra el lote y lo que quedó impreso en cada carnet (hace commit)."""
+    model = CARD_SOURCES[kind]["model"]
+    # updated_at se asigna a sí mismo para que imprimir no cuente como cambio
+    db.execute(
+        update(model.__table__)
+        .where(model.id == bindparam("card_id"))
+        .values(card_printed_at=datetime.now(), card_fingerprint=bindparam("fingerprint"),
+                updated_at=model.updated_at),
+        [{"card_id": card["id"], "fingerprint": card["fingerprint"]} for card in cards]
+    )
+    db.add(models.CardPrintRun(
+        kind=kind,
+        job_id=job_id,
+        card_count=len(cards),
+        only_changed=only_changed,
+        filters=filters,
+        created_by=user_id,
+    ))
+    db.commit()
+
+def _render_cards_job(job, db: Session, kind: str, group: str, ids: list, changed_since: datetime,
+                      layout: dict = None, only_changed: bool = False, user_id: int = None):
+    source = CARD_SOURCES[kind]
+    people = _select_people(db, kind, group, ids, changed_since)
+    cards = _snapshots(people, source["is_employee"], only_changed)
+    db.close()
+
+    if not cards:
+        job.finish("No hay carnets para generar con ese filtro", source["back_url"])
+        return
+    job.set_total(len(cards))
+
+    _cleanup_batches()
+    path = _batch_path(job.job_id)
+    tmp_path = f"{path}.tmp"
+    card_render.render_batch(cards, tmp_path, progress=job.advance, layout=layout)
+    os.replace(tmp_path, path)
+
+    _record_print_run(db, kind, cards, _filters_label(group, ids, changed_since, only_changed),
+                      only_changed, job_id=job.job_id, user_id=user_id)
+    job.finish(f"{len(cards)} carnets de {source['label']} generados", f"/cards/batch/download/{job.job_id}")
+
+def _submit_batch(request: Request, kind: str, group, ids, changed_since, only_changed,
+                  sheet, cols, rows, duplex):
+    """Valida los filtros del formulario y encola el lote. Retorna la redirección."""
+    back_url = CARD_SOURCES[kind]["back_url"]
+    since = None
+    if changed_since:
+        try:
+            since = datetime.strptime(changed_since, "%Y-%m-%d")
+        except ValueError:
+            return RedirectResponse(url=f"{back_url}?error=Fecha inválida (use AAAA-MM-DD)", status_code=303)
+
+    layout = None
+    if sheet:
+        if sheet.upper() not in card_render.SHEET_SIZES or not (cols or "0").isdigit() or not (rows or "0").isdigit():
+            return RedirectResponse(url=f"{back_url}?error=Hoja o grilla inválida", status_code=303)
+        try:
+            layout = card_render.sheet_layout(sheet, int(cols or 0), int(rows or 0), duplex)
+        except ValueError as e:
+            return RedirectResponse(url=f"{back_url}?error={e}", status_code=303)
+
+    user = request.state.user
+    job_id = jobs.submit(f"cards.{kind}-pdf", _render_cards_job, kind, group or None, _parse_ids(ids),
+                         since, layout, only_changed, user.id if user else None,
+                         user=user, result_url=back_url)
+    return RedirectResponse(url=f"/jobs/{job_id}", status_code=303)
+
 @router.get("/batch/pdf")
-def download_all_cards_pdf(db: Session = Depends(database.get_db)):
-    # Solo estudiantes por defecto en el batch general
-    students = db.query(models.Student).order_by(models.Student.course).all()
-    buffer = io.BytesIO()
-    c = canvas.Canvas(buffer, pagesize=(CARD_WIDTH, CARD_HEIGHT))
-    for s in students:
-        draw_card(c, s, is_employee=False)
-        c.showPage()
-    c.save()
-    buffer.seek(0)
-    return Response(content=buffer.getvalue(), headers={'Content-Disposition': 'attachment; filename="todos_carnets.pdf"'}, media_type='application/pdf')
+def download_all_cards_pdf(
+    request: Request,
+    course: Optional[str] = Query(None),
+    ids: Optional[str] = Query(None),              # IDs separados por coma
+    changed_since: Optional[str] = Query(None),    # AAAA-MM-DD
+    only_changed: bool = Query(False),             # Solo cambios desde el último lote
+    sheet: Optional[str] = Query(None),            # A4 / LETTER: varios carnets por hoja
+    cols: Optional[str] = Query(None),
+    rows: Optional[str] = Query(None),
+    duplex: bool = Query(False),
+):
+    return _submit_batch(request, "students", course, ids, changed_since, only_changed,
+                         sheet, cols, rows, duplex)
+
+@router.get("/employee/batch/pdf")
+def download_all_employee_cards_pdf(
+    request: Request,
+    position: Optional[str] = Query(None),
+    ids: Optional[str] = Query(None),              # Cédulas separadas por coma
+    changed_since: Optional[str] = Query(None),
+    only_changed: bool = Query(False),
+    sheet: Optional[str] = Query(None),
+    cols: Optional[str] = Query(None),
+    rows: Optional[str] = Query(None),
+    duplex: bool = Query(False),
+):
+    return _submit_batch(request, "employees", position, ids, changed_since, only_changed,
+                         sheet, cols, rows, duplex)
+
+@router.get("/batch/download/{job_id}")
+def download_batch_result(job_id: str):
+    path = _batch_path(job_id)
+    if not job_id.isalnum() or not os.path.exists(path):
+        raise HTTPException(404, "El lote no existe o ya expiró")
+    return FileResponse(path, media_type="application/pdf", filename="carnets.pdf")
+
+class _ZipStream(io.RawIOBase):
+    """Destino de escritura para ZipFile que entrega los bytes por partes (sin seek)."""
+
+    def __init__(self):
+        self._chunks = []
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def pop(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks.clear()
+        return data
+
+def _stream_qr_zip(cards, fmt: str = "png"):
+    render = qr.FORMATS[fmt][0]
+    # PNG ya viene comprimido; SVG/EPS son texto y sí se comprimen
+    compression = zipfile.ZIP_STORED if fmt == "png" else zipfile.ZIP_DEFLATED
+    # ZipFile acepta salidas no buscables: escribe descriptores al final de cada archivo
+    stream = _ZipStream()
+    with zipfile.ZipFile(stream, "w", compression) as zf:
+        for key, payload in cards:
+            zf.writestr(f"{key}.{fmt}", render(payload))
+            yield stream.pop()
+    yield stream.pop()
+
+def _qr_zip_response(db: Session, kind: str, group, ids, changed_since, only_changed, fmt: str, filename: str):
+    source = CARD_SOURCES[kind]
+    if fmt not in qr.FORMATS:
+        return RedirectResponse(url=f"{source['back_url']}?error=Formato de QR inválido (png, svg o eps)", status_code=303)
+    since = None
+    if changed_since:
+        try:
+            since = datetime.strptime(changed_since, "%Y-%m-%d")
+        except ValueError:
+            return RedirectResponse(url=f"{source['back_url']}?error=Fecha inválida (use AAAA-MM-DD)", status_code=303)
+
+    # Mismo filtro de "solo cambios" que los lotes PDF, pero sin registrar nada:
+    # exportar los QR (ej. para el equipo de diseño) no es imprimir los carnets,
+    # solo _render_cards_job marca lo impreso
+    people = _select_people(db, kind, group, _parse_ids(ids), since)
+    cards = _snapshots(people, source["is_employee"], only_changed)
+
+    # La conexión vuelve al pool antes de la descarga (la sesión de la dependencia
+    # se cerraría recién al terminar de enviar el ZIP)
+    db.close()
+
+    # El ZIP se arma y se envía archivo por archivo con los QR ya firmados
+    return StreamingResponse(
+        lanes.iterate_in("bulk", _stream_qr_zip([(card["key"], card["qr_payload"]) for card in cards], fmt)),
+        headers={'Content-Disposition': f'attachment; filename="{filename}"'},
+        media_type='application/zip'
+    )
 
 @router.get("/batch/qr-images")
-def download_all_qrs_zip(db: Session = Depends(database.get_db)):
-    students = db.query(models.Student).all()
-    zip_buffer = io.BytesIO()
-    with zipfile.ZipFile(zip_buffer, "a", zipfile.ZIP_DEFLATED, False) as zf:
-        for s in students:
-            qr = generate_qr_image(auth.sign_qr_content(s.student_id))
-            ib = io.BytesIO(); qr.save(ib, format="PNG"); ib.seek(0)
-            zf.writestr(f"{s.student_id}.png", ib.getvalue())
-    zip_buffer.seek(0)
-    return Response(content=zip_buffer.getvalue(), headers={'Content-Disposition': 'attachment; filename="qrs.zip"'}, media_type='application/zip')
\ No newline at end of file
+@lanes.bulk
+def download_all_qrs_zip(
+    course: Optional[str] = Query(None),
+    ids: Optional[str] = Query(None),
+    changed_since: Optional[str] = Query(None),
+    only_changed: bool = Query(False),
+    format: str = Query("png"),                    # png / svg / eps
+    db: Session = Depends(database.get_bulk_db)
+):
+    return _qr_zip_response(db, "students", course, ids, changed_since, only_changed, format.lower(), "qrs.zip")
+
+@router.get("/employee/batch/qr-images")
+@lanes.bulk
+def download_all_employee_qrs_zip(
+    position: Optional[str] = Query(None),
+    ids: Optional[str] = Query(None),
+    changed_since: Optional[str] = Query(None),
+    only_changed: bool = Query(False),
+    format: str = Query("png"),                    # png / svg / eps
+    db: Session = Depends(database.get_bulk_db)
+):
+    return _qr_zip_response(db, "employees", position, ids, changed_since, only_changed, format.lower(), "qrs_empleados.zip")
@@ -1,14 +1,14 @@
 from fastapi import APIRouter, Depends, Request, Query
-from fastapi.templating import Jinja2Templates
-from sqlalchemy.orm import Session
+from sqlalchemy.orm import Session, joinedload
 from sqlalchemy import func, cast, Date
 from datetime import datetime
 import pytz
-from .. import database, models, deps
+from .. import database, models, deps, photos
+from ..templating import templates
 
 router = APIRouter(dependencies=[Depends(deps.require_user)])
-templates = Jinja2Templates(directory="app/templates")
 TZ_COLOMBIA = pytz.timezone('America/Bogota')
+DETAIL_PHOTO_PX = 64  # Listas de detalle: 32px CSS
 
 def get_date_obj(date_str: str = None):
     if date_str:
@@ -90,12 +90,14 @@ def get_exit_charts(date: str = Query(None), db: Session = Depends(database.get_
 @router.get("/api/dashboard/details")
 def get_exit_details(type: str = Query(...), id: int = Query(None), date: str = Query(None), db: Session = Depends(database.get_db)):
     target_date = get_date_obj(date)
-    q = db.query(models.ExitLog).filter(cast(models.ExitLog.timestamp, Date) == target_date)
+    q = db.query(models.ExitLog)\
+        .options(joinedload(models.ExitLog.student), joinedload(models.ExitLog.door))\
+        .filter(cast(models.ExitLog.timestamp, Date) == target_date)
     if type == 'door' and id: q = q.filter(models.ExitLog.door_id == id)
     
     logs = q.order_by(models.ExitLog.timestamp.desc()).all()
     return [{
-        "photo": l.student.photo_path, "name": l.student.full_name,
+        "photo": photos.variant_url(l.student.photo_path, DETAIL_PHOTO_PX), "name": l.student.full_name,
         "course": l.student.course, "time": l.timestamp.strftime("%I:%M:%S %p"),
         "door": l.door.name
     } for l in logs]
@@ -154,7 +156,9 @@ def get_lunch_charts(date: str = Query(None), db: Session = Depends(database.get
 @router.get("/api/dashboard/lunch/details")
 def get_lunch_details(type: str = Query(...), date: str = Query(None), db: Session = Depends(database.get_db)):
     target_date = get_date_obj(date)
-    q = db.query(models.LunchLog).filter(cast(models.LunchLog.timestamp, Date) == target_date)
+    q = db.query(models.LunchLog)\
+        .options(joinedload(models.LunchLog.student), joinedload(models.LunchLog.employee))\
+        .filter(cast(models.LunchLog.timestamp, Date) == target_date)
     
     if type == 'Normal': q = q.filter(models.LunchLog.delivered_type == 'Normal')
     elif type == 'Especial': q = q.filter(models.LunchLog.delivered_type == 'Especial')
@@ -165,11 +169,11 @@ def get_lunch_details(type: str = Query(...), date: str = Query(None), db: Sessi
     for l in logs:
         if l.student:
             name = l.student.full_name
-            photo = l.student.photo_path
+            photo = photos.variant_url(l.student.photo_path, DETAIL_PHOTO_PX)
             extra = l.student.course
         elif l.employee:
             name = l.employee.full_name
-            photo = l.employee.photo_path
+            photo = photos.variant_url(l.employee.photo_path, DETAIL_PHOTO_PX)
             extra = l.employee.position
         else:
             name = "?"
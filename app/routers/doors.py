@@ -1,9 +1,9 @@
 from fastapi import APIRouter, Depends, Form, HTTPException
 from fastapi.responses import RedirectResponse
-from fastapi.templating import Jinja2Templates
 from sqlalchemy.orm import Session
 from starlette.requests import Request
 from .. import database, models, deps
+from ..templating import templates
 
 router = APIRouter(
     prefix="/doors",
@@ -11,7 +11,6 @@ router = APIRouter(
     dependencies=[Depends(deps.require_admin)]
 )
 
-templates = Jinja2Templates(directory="app/templates")
 
 @router.get("/")
 def list_doors(request: Request, db: Session = Depends(database.get_db)):
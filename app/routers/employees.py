@@ -1,15 +1,12 @@
 from fastapi import APIRouter, Depends, Form, UploadFile, File, Response, Request
 from fastapi.responses import RedirectResponse
-from fastapi.templating import Jinja2Templates
 from sqlalchemy.orm import Session
-from sqlalchemy import or_
-import pandas as pd
-import io
 import math
 import os
 import shutil
 from typing import Optional
-from .. import database, models, deps
+from .. import database, models, deps, jobs, pagination, photos
+from ..templating import templates
 
 router = APIRouter(
     prefix="/employees",
@@ -17,40 +14,52 @@ router = APIRouter(
     dependencies=[Depends(deps.require_admin)]
 )
 
-templates = Jinja2Templates(directory="app/templates")
 PHOTOS_DIR = "app/static/photos"
 
 # --- VISTA LISTADO ---
 @router.get("/")
 def list_employees(
     request: Request, 
-    page: int = 1, 
+    page: int = 1,       # Número de página (solo para mostrar)
     search: str = "", 
+    after: int = None,   # Cursor: id del último empleado de la página anterior
+    before: int = None,  # Cursor: id del primer empleado de la página siguiente
+    last: bool = False,
     db: Session = Depends(database.get_db)
 ):
     limit = 20
     query = db.query(models.Employee)
     
     if search:
-        search_pattern = f"%{search}%"
-        query = query.filter(or_(
-            models.Employee.full_name.like(search_pattern),
-            models.Employee.doc_id.like(search_pattern)
-        ))
+        query = query.filter(
+            pagination.search_filter(db, search, models.Employee.full_name, models.Employee.doc_id)
+        )
     
-    total_records = query.count()
+    total_records = pagination.cached_count("employees", search, query)
     total_pages = math.ceil(total_records / limit)
     
-    if page < 1: page = 1
-    if page > total_pages and total_pages > 0: page = total_pages
-    offset = (page - 1) * limit
+    # Paginación por cursor sobre (full_name, id)
+    employees, nav = pagination.keyset_paginate(
+        db, query, models.Employee.full_name, models.Employee.id, limit,
+        after=after, before=before, last=last, total=total_records
+    )
+    if last:
+        page = max(total_pages, 1)
+    elif not nav["has_prev"]:
+        page = 1
     
-    employees = query.order_by(models.Employee.full_name.asc()).offset(offset).limit(limit).all()
+    # Cargos para el filtro de lotes de carnets
+    positions = pagination.cached("employees", "positions", lambda: [
+        p for (p,) in db.query(models.Employee.position).filter(models.Employee.position.isnot(None))
+        .distinct().order_by(models.Employee.position)
+    ])
     
     return templates.TemplateResponse("employees.html", {
         "request": request, 
         "employees": employees, 
+        "positions": positions,
         "page": page, "total_pages": total_pages, "search": search,
+        "total_records": total_records, "nav": nav,
         "user": request.state.user
     })
 
@@ -78,6 +87,7 @@ def create_employee(
             with open(file_location, "wb") as buffer:
                 shutil.copyfileobj(photo.file, buffer)
             photo_path = f"/static/photos/{filename}"
+            photos.refresh_variants(photo_path)
 
     # --- CORRECCIÓN AQUÍ ---
     # Convertimos el string "Normal" al objeto Enum <LunchType.NORMAL>
@@ -125,13 +135,24 @@ def delete_employee(id: int, db: Session = Depends(database.get_db)):
 # --- IMPORTACIONES ---
 
 @router.post("/import-basic")
-async def import_basic(file: UploadFile = File(...), db: Session = Depends(database.get_db)):
+def import_basic(request: Request, file: UploadFile = File(...)):
     """Carga inicial de empleados (ID, Nombre, Cargo)"""
     if not file.filename.endswith(('.xls', '.xlsx')): return RedirectResponse("/employees?error=Formato+invalido", 303)
+    xlsx_path = jobs.spool_upload(file, os.path.splitext(file.filename)[1])
+    job_id = jobs.submit("employees.import-basic", _import_basic_job, xlsx_path,
+                         user=request.state.user, result_url="/employees")
+    return RedirectResponse(f"/jobs/{job_id}", 303)
+
+def _import_basic_job(job, db: Session, xlsx_path: str):
+    import pandas as pd  # Se importa aquí y no al cargar el módulo: arranque del worker más liviano
     try:
-        df = pd.read_excel(io.BytesIO(await file.read()))
-        count = 0
-        for _, row in df.iterrows():
+        df = pd.read_excel(xlsx_path)
+    finally:
+        os.remove(xlsx_path)
+    job.set_total(len(df))
+    count = 0
+    for i, row in df.iterrows():
+        try:
             did = str(row[0]).strip()
             name = str(row[1]).strip()
             pos = str(row[2]).strip() if len(row) > 2 else ""
@@ -140,66 +161,90 @@ async def import_basic(file: UploadFile = File(...), db: Session = Depends(datab
             if not existing:
                 db.add(models.Employee(doc_id=did, full_name=name, position=pos))
                 count += 1
-        db.commit()
-        return RedirectResponse(f"/employees?msg=Creados+{count}+empleados", 303)
-    except Exception: return RedirectResponse("/employees?error=Error+archivo", 303)
+        except Exception as e:
+            job.error(f"Fila {i + 2}: {e}")
+        job.advance()
+    db.commit()
+    job.finish(f"Creados {count} empleados", f"/employees?msg=Creados+{count}+empleados")
 
 @router.post("/update-lunch-groups")
-async def update_lunch_groups(file: UploadFile = File(...), db: Session = Depends(database.get_db)):
+def update_lunch_groups(request: Request, file: UploadFile = File(...)):
     """
     Actualiza permisos de almuerzo basado en columna 'grupos'.
     Logica: Busca 'ALMUERZO NORMAL' o 'ALMUERZO ESPECIAL'.
     """
     if not file.filename.endswith(('.xls', '.xlsx')): return RedirectResponse("/employees?error=Formato+invalido", 303)
+    xlsx_path = jobs.spool_upload(file, os.path.splitext(file.filename)[1])
+    job_id = jobs.submit("employees.update-lunch-groups", _update_lunch_groups_job, xlsx_path,
+                         user=request.state.user, result_url="/employees")
+    return RedirectResponse(f"/jobs/{job_id}", 303)
+
+def _update_lunch_groups_job(job, db: Session, xlsx_path: str):
+    import pandas as pd
     try:
-        df = pd.read_excel(io.BytesIO(await file.read()))
-        updated = 0
-        
-        # Asumimos Col 0: ID, Col 1: Grupos (Texto largo)
-        for _, row in df.iterrows():
-            did = str(row[0]).strip()
-            raw_groups = str(row[1]).upper() # Convertir a mayúsculas para buscar
-            
-            emp = db.query(models.Employee).filter(models.Employee.doc_id == did).first()
-            if emp:
-                if "ALMUERZO NORMAL" in raw_groups:
-                    emp.has_lunch = True
-                    emp.lunch_type = models.LunchType.NORMAL.value
-                elif "ALMUERZO ESPECIAL" in raw_groups:
-                    emp.has_lunch = True
-                    emp.lunch_type = models.LunchType.ESPECIAL.value
-                else:
-                    # Si no aparece ninguno, quitamos el almuerzo
-                    emp.has_lunch = False
-                    emp.lunch_type = models.LunchType.NONE
-                updated += 1
+        df = pd.read_excel(xlsx_path)
+    finally:
+        os.remove(xlsx_path)
+    job.set_total(len(df))
+    updated = 0
+    
+    # Asumimos Col 0: ID, Col 1: Grupos (Texto largo)
+    for i, row in df.iterrows():
+        did = str(row[0]).strip()
+        raw_groups = str(row[1]).upper() # Convertir a mayúsculas para buscar
         
-        db.commit()
-        return RedirectResponse(f"/employees?msg=Almuerzos+actualizados:+{updated}", 303)
-    except Exception as e: 
-        print(e)
-        return RedirectResponse("/employees?error=Error+procesando+grupos", 303)
+        emp = db.query(models.Employee).filter(models.Employee.doc_id == did).first()
+        if emp:
+            if "ALMUERZO NORMAL" in raw_groups:
+                emp.has_lunch = True
+                emp.lunch_type = models.LunchType.NORMAL.value
+            elif "ALMUERZO ESPECIAL" in raw_groups:
+                emp.has_lunch = True
+                emp.lunch_type = models.LunchType.ESPECIAL.value
+            else:
+                # Si no aparece ninguno, quitamos el almuerzo
+                emp.has_lunch = False
+                emp.lunch_type = models.LunchType.NONE
+            updated += 1
+        else:
+            job.error(f"Fila {i + 2}: empleado {did} no encontrado")
+        job.advance()
+    
+    db.commit()
+    job.finish(f"Almuerzos actualizados: {updated}", f"/employees?msg=Almuerzos+actualizados:+{updated}")
 
 @router.post("/update-rfid")
-async def update_rfid(file: UploadFile = File(...), db: Session = Depends(database.get_db)):
+def update_rfid(request: Request, file: UploadFile = File(...)):
     """Actualiza solo el código RFID. Col 0: ID, Col 1: RFID"""
     if not file.filename.endswith(('.xls', '.xlsx')): return RedirectResponse("/employees?error=Formato+invalido", 303)
+    xlsx_path = jobs.spool_upload(file, os.path.splitext(file.filename)[1])
+    job_id = jobs.submit("employees.update-rfid", _update_rfid_job, xlsx_path,
+                         user=request.state.user, result_url="/employees")
+    return RedirectResponse(f"/jobs/{job_id}", 303)
+
+def _update_rfid_job(job, db: Session, xlsx_path: str):
+    import pandas as pd
     try:
-        df = pd.read_excel(io.BytesIO(await file.read()))
-        updated = 0
-        for _, row in df.iterrows():
-            did = str(row[0]).strip()
-            rfid = str(row[1]).strip()
-            # Limpieza básica de RFID (quitar decimales si excel lo pone como float)
-            if rfid.endswith('.0'): rfid = rfid[:-2]
-
-            emp = db.query(models.Employee).filter(models.Employee.doc_id == did).first()
-            if emp:
-                emp.rfid_code = rfid
-                updated += 1
-        db.commit()
-        return RedirectResponse(f"/employees?msg=RFIDs+actualizados:+{updated}", 303)
-    except Exception: return RedirectResponse("/employees?error=Error+archivo", 303)
+        df = pd.read_excel(xlsx_path)
+    finally:
+        os.remove(xlsx_path)
+    job.set_total(len(df))
+    updated = 0
+    for i, row in df.iterrows():
+        did = str(row[0]).strip()
+        rfid = str(row[1]).strip()
+        # Limpieza básica de RFID (quitar decimales si excel lo pone como float)
+        if rfid.endswith('.0'): rfid = rfid[:-2]
+
+        emp = db.query(models.Employee).filter(models.Employee.doc_id == did).first()
+        if emp:
+            emp.rfid_code = rfid
+            updated += 1
+        else:
+            job.error(f"Fila {i + 2}: empleado {did} no encontrado")
+        job.advance()
+    db.commit()
+    job.finish(f"RFIDs actualizados: {updated}", f"/employees?msg=RFIDs+actualizados:+{updated}")
 
 @router.post("/update")
 def update_employee(
@@ -237,6 +282,7 @@ def update_employee(
             with open(file_location, "wb") as buffer:
                 shutil.copyfileobj(photo.file, buffer)
             emp.photo_path = f"/static/photos/{filename}"
+            photos.refresh_variants(emp.photo_path)
 
     db.commit()
     return RedirectResponse(url="/employees?msg=Empleado+actualizado", status_code=303)
\ No newline at end of file
@@ -0,0 +1,29 @@
+from fastapi import APIRouter, Depends, HTTPException, Request
+from sqlalchemy.orm import Session
+from .. import database, models, deps, jobs
+from ..templating import templates
+
+router = APIRouter(
+    prefix="/jobs",
+    tags=["Jobs"],
+    dependencies=[Depends(deps.require_admin)]
+)
+
+
+def _get_job(job_id: str, db: Session):
+    job = db.query(models.Job).filter(models.Job.id == job_id).first()
+    if not job: raise HTTPException(404, "Tarea no encontrada")
+    return job
+
+@router.get("/{job_id}")
+def job_view(job_id: str, request: Request, db: Session = Depends(database.get_db)):
+    job = _get_job(job_id, db)
+    return templates.TemplateResponse("job.html", {
+        "request": request,
+        "user": request.state.user,
+        "job": jobs.job_status(job)
+    })
+
+@router.get("/{job_id}/status")
+def job_status(job_id: str, db: Session = Depends(database.get_db)):
+    return jobs.job_status(_get_job(job_id, db))
@@ -1,12 +1,11 @@
 from fastapi import APIRouter, Depends, Request, HTTPException, Query
 from fastapi.responses import JSONResponse, Response
-from fastapi.templating import Jinja2Templates
-from sqlalchemy.orm import Session
+from sqlalchemy.orm import Session, joinedload
 from sqlalchemy import cast, Date, desc, or_
 from datetime import datetime
 import pytz
-from .. import database, models, deps, auth
-import pandas as pd
+from .. import database, models, deps, auth, photos, lanes
+from ..templating import templates
 import io
 
 
@@ -16,8 +15,9 @@ router = APIRouter(
     dependencies=[Depends(deps.require_lunch_access)] # Solo Admin y Operador Almuerzo
 )
 
-templates = Jinja2Templates(directory="app/templates")
 TZ_COLOMBIA = pytz.timezone('America/Bogota')
+PHOTO_PX = 256        # Foto del resultado: 128px CSS en pantallas 2x
+SEARCH_PHOTO_PX = 80  # Lista de búsqueda: 40px CSS
 
 @router.get("/scan")
 def lunch_scan_view(request: Request):
@@ -49,7 +49,7 @@ def search_person_for_lunch(q: str = Query(..., min_length=3), db: Session = Dep
             "name": s.full_name,
             "type": "Estudiante",
             "extra": s.course,
-            "photo": s.photo_path
+            "photo": photos.variant_url(s.photo_path, SEARCH_PHOTO_PX)
         })
         
     for e in employees:
@@ -58,14 +58,41 @@ def search_person_for_lunch(q: str = Query(..., min_length=3), db: Session = Dep
             "name": e.full_name,
             "type": "Empleado",
             "extra": e.position or "General",
-            "photo": e.photo_path
+            "photo": photos.variant_url(e.photo_path, SEARCH_PHOTO_PX)
         })
         
     return results
 
 @router.post("/process")
-async def process_lunch(request: Request, db: Session = Depends(database.get_db)):
+async def process_lunch(request: Request):
     data = await request.json()
+    # Carril de escaneo: hilos y conexiones reservados, aunque haya exportaciones en curso
+    return await lanes.run_in("scan", _process_lunch, data, request.state.user)
+
+def _process_lunch(data: dict, user):
+    db = database.ScanSessionLocal()
+    try:
+        return _register_lunch(db, data, user)
+    finally:
+        db.close()
+
+def warm_up(db: Session):
+    """Ejecuta una vez las consultas del comedor (SQL compilado) y carga las fotos en memoria."""
+    db.query(models.Student).filter(
+        (models.Student.rfid_code == "") | (models.Student.student_id == "")
+    ).first()
+    db.query(models.Employee).filter(
+        (models.Employee.rfid_code == "") | (models.Employee.doc_id == "")
+    ).first()
+    db.query(models.LunchLog).filter(
+        cast(models.LunchLog.timestamp, Date) == datetime.now(TZ_COLOMBIA).date(),
+        models.LunchLog.student_id == 0
+    ).first()
+    photo_paths = [p for (p,) in db.query(models.Student.photo_path).filter(models.Student.has_lunch == True, models.Student.photo_path.isnot(None))]
+    photo_paths += [p for (p,) in db.query(models.Employee.photo_path).filter(models.Employee.has_lunch == True, models.Employee.photo_path.isnot(None))]
+    return photos.warm_variant_index(photo_paths, PHOTO_PX)
+
+def _register_lunch(db: Session, data: dict, user):
     raw_code = data.get("code", "").strip() # Puede ser QR firmado o RFID plano
     
     if not raw_code:
@@ -75,7 +102,7 @@ async def process_lunch(request: Request, db: Session = Depends(database.get_db)
     person = None
     person_type = None # 'student' | 'employee'
     
-    # A. Verificación QR Firmado (Si tiene punto, asumimos formato ID.FIRMA)
+    # A. Verificación QR Firmado (formato compacto o el anterior ID.FIRMA)
     clean_id = auth.verify_qr_content(raw_code)
     
     if clean_id:
@@ -117,7 +144,7 @@ async def process_lunch(request: Request, db: Session = Depends(database.get_db)
             "message": "NO TIENE ALMUERZO ASIGNADO",
             "person": {
                 "name": person.full_name,
-                "photo": person.photo_path,
+                "photo": photos.variant_url(person.photo_path, PHOTO_PX),
                 "type": "Estudiante" if person_type == 'student' else "Empleado"
             }
         })
@@ -146,14 +173,14 @@ async def process_lunch(request: Request, db: Session = Depends(database.get_db)
             "lunch_type": person.lunch_type, # Enviamos el tipo para mostrarlo en grande
             "person": {
                 "name": person.full_name,
-                "photo": person.photo_path,
+                "photo": photos.variant_url(person.photo_path, PHOTO_PX),
                 "type": "Estudiante" if person_type == 'student' else "Empleado",
                 "extra": extra_info # Enviamos el cargo/curso
             }
         })
 
     # 4. REGISTRAR ENTREGA
-    operator_id = request.state.user.id if request.state.user else 1
+    operator_id = user.id if user else 1
     
     # Manejar el tipo de almuerzo (asegurar que guardamos el string)
     # En modelo Employee es String, en Student ahora es String (según cambio parte anterior)
@@ -180,7 +207,7 @@ async def process_lunch(request: Request, db: Session = Depends(database.get_db)
         "timestamp": now_co.strftime("%Y-%m-%d %H:%M:%S"),
         "person": {
             "name": person.full_name,
-            "photo": person.photo_path,
+            "photo": photos.variant_url(person.photo_path, PHOTO_PX),
             "type": "Estudiante" if person_type == 'student' else "Empleado",
             "extra": extra_info
         },
@@ -196,14 +223,22 @@ async def process_lunch(request: Request, db: Session = Depends(database.get_db)
 
 # --- REPORTES ---
 
+# Persona y operador en la misma consulta (se muestran en cada fila)
+_LOG_RELATIONS = (
+    joinedload(models.LunchLog.student),
+    joinedload(models.LunchLog.employee),
+    joinedload(models.LunchLog.operator),
+)
+
 @router.get("/reports")
+@lanes.bulk
 def lunch_reports_view(
     request: Request,
     date_start: str = Query(None),
     date_end: str = Query(None),
     lunch_type: str = Query(None), # Normal, Especial
     person_type: str = Query(None), # student, employee
-    db: Session = Depends(database.get_db)
+    db: Session = Depends(database.get_bulk_db)
 ):
     now = datetime.now(TZ_COLOMBIA)
     if not date_start: date_start = now.strftime('%Y-%m-%d')
@@ -212,7 +247,8 @@ def lunch_reports_view(
     start_dt = datetime.strptime(date_start, '%Y-%m-%d').replace(hour=0, minute=0, second=0)
     end_dt = datetime.strptime(date_end, '%Y-%m-%d').replace(hour=23, minute=59, second=59)
 
-    query = db.query(models.LunchLog).filter(models.LunchLog.timestamp >= start_dt, models.LunchLog.timestamp <= end_dt)
+    query = db.query(models.LunchLog).options(*_LOG_RELATIONS)\
+        .filter(models.LunchLog.timestamp >= start_dt, models.LunchLog.timestamp <= end_dt)
 
     if lunch_type and lunch_type != "Todos":
         query = query.filter(models.LunchLog.delivered_type == lunch_type)
@@ -239,17 +275,19 @@ def lunch_reports_view(
     })
 
 @router.get("/reports/export")
+@lanes.bulk
 def export_lunch_excel(
     date_start: str = Query(...),
     date_end: str = Query(...),
     lunch_type: str = Query(None),
     person_type: str = Query(None),
-    db: Session = Depends(database.get_db)
+    db: Session = Depends(database.get_bulk_db)
 ):
     # (Misma lógica de filtrado que arriba)
     start_dt = datetime.strptime(date_start, '%Y-%m-%d').replace(hour=0, minute=0, second=0)
     end_dt = datetime.strptime(date_end, '%Y-%m-%d').replace(hour=23, minute=59, second=59)
-    query = db.query(models.LunchLog).filter(models.LunchLog.timestamp >= start_dt, models.LunchLog.timestamp <= end_dt)
+    query = db.query(models.LunchLog).options(*_LOG_RELATIONS)\
+        .filter(models.LunchLog.timestamp >= start_dt, models.LunchLog.timestamp <= end_dt)
 
     if lunch_type and lunch_type != "Todos": query = query.filter(models.LunchLog.delivered_type == lunch_type)
     if person_type == "student": query = query.filter(models.LunchLog.student_id != None)
@@ -283,6 +321,7 @@ def export_lunch_excel(
             "Operador": log.operator.username
         })
 
+    import pandas as pd  # Se importa aquí y no al cargar el módulo: arranque del worker más liviano
     df = pd.DataFrame(data)
     output = io.BytesIO()
     with pd.ExcelWriter(output, engine='openpyxl') as writer:
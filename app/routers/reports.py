@@ -1,13 +1,12 @@
 from fastapi import APIRouter, Depends, Request, Query
 from fastapi.responses import Response
-from fastapi.templating import Jinja2Templates
-from sqlalchemy.orm import Session
+from sqlalchemy.orm import Session, joinedload, contains_eager
 from sqlalchemy import desc
 from datetime import datetime
-import pandas as pd
 import io
 import pytz
-from .. import database, models, deps
+from .. import database, models, deps, lanes
+from ..templating import templates
 
 router = APIRouter(
     prefix="/reports",
@@ -15,17 +14,17 @@ router = APIRouter(
     dependencies=[Depends(deps.require_user)]
 )
 
-templates = Jinja2Templates(directory="app/templates")
 TZ_COLOMBIA = pytz.timezone('America/Bogota')
 
 @router.get("/")
+@lanes.bulk
 def view_reports(
     request: Request, 
     date_start: str = Query(None), 
     date_end: str = Query(None),
     # CAMBIO: Recibir como str para manejar la cadena vacía "" sin error
     door_id: str = Query(None), 
-    db: Session = Depends(database.get_db)
+    db: Session = Depends(database.get_bulk_db)
 ):
     # Configurar fechas por defecto
     now = datetime.now(TZ_COLOMBIA)
@@ -37,7 +36,12 @@ def view_reports(
     start_dt = datetime.strptime(date_start, '%Y-%m-%d').replace(hour=0, minute=0, second=0)
     end_dt = datetime.strptime(date_end, '%Y-%m-%d').replace(hour=23, minute=59, second=59)
 
-    query = db.query(models.ExitLog).filter(
+    # Relaciones en la misma consulta: la plantilla las usa en cada fila
+    query = db.query(models.ExitLog).options(
+        joinedload(models.ExitLog.student),
+        joinedload(models.ExitLog.door),
+        joinedload(models.ExitLog.operator),
+    ).filter(
         models.ExitLog.timestamp >= start_dt,
         models.ExitLog.timestamp <= end_dt
     )
@@ -64,17 +68,22 @@ def view_reports(
     })
 
 @router.get("/export")
+@lanes.bulk
 def export_reports(
     date_start: str = Query(...), 
     date_end: str = Query(...),
     # CAMBIO: Recibir como str también aquí
     door_id: str = Query(None),
-    db: Session = Depends(database.get_db)
+    db: Session = Depends(database.get_bulk_db)
 ):
     start_dt = datetime.strptime(date_start, '%Y-%m-%d').replace(hour=0, minute=0, second=0)
     end_dt = datetime.strptime(date_end, '%Y-%m-%d').replace(hour=23, minute=59, second=59)
     
-    query = db.query(models.ExitLog).join(models.Student).join(models.Door).join(models.User).filter(
+    query = db.query(models.ExitLog).join(models.Student).join(models.Door).join(models.User).options(
+        contains_eager(models.ExitLog.student),
+        contains_eager(models.ExitLog.door),
+        contains_eager(models.ExitLog.operator),
+    ).filter(
         models.ExitLog.timestamp >= start_dt,
         models.ExitLog.timestamp <= end_dt
     )
@@ -97,6 +106,7 @@ def export_reports(
             "Operador": log.operator.username
         })
         
+    import pandas as pd  # Se importa aquí y no al cargar el módulo: arranque del worker más liviano
     df = pd.DataFrame(data)
     
     output = io.BytesIO()
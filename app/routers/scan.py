@@ -1,20 +1,20 @@
 from fastapi import APIRouter, Depends, HTTPException, Request
 from fastapi.responses import JSONResponse
-from fastapi.templating import Jinja2Templates
 from sqlalchemy.orm import Session
 from datetime import datetime, timedelta
 import pytz
-from .. import database, models, deps, auth
+from .. import database, models, deps, auth, photos, lanes
+from ..templating import templates
 
 router = APIRouter(
     prefix="/scan",
     tags=["Scanner"],
-    dependencies=[Depends(deps.require_user)]
+    dependencies=[Depends(deps.require_scan_user)]
 )
 
-templates = Jinja2Templates(directory="app/templates")
 TZ_COLOMBIA = pytz.timezone('America/Bogota')
 COOLDOWN_MINUTES = 15  # <-- CONFIGURACIÓN: Tiempo mínimo entre salidas (en minutos)
+PHOTO_PX = 192  # Foto del resultado: 96px CSS en pantallas 2x
 
 @router.get("/")
 def scan_interface(request: Request, db: Session = Depends(database.get_db)):
@@ -34,8 +34,28 @@ def scan_interface(request: Request, db: Session = Depends(database.get_db)):
     })
 
 @router.post("/process")
-async def process_scan(request: Request, db: Session = Depends(database.get_db)):
+async def process_scan(request: Request):
     data = await request.json()
+    # Carril de escaneo: hilos y conexiones reservados, aunque haya exportaciones en curso
+    return await lanes.run_in("scan", _process_scan, data, request.state.user)
+
+def _process_scan(data: dict, user):
+    db = database.ScanSessionLocal()
+    try:
+        return _register_exit(db, data, user)
+    finally:
+        db.close()
+
+def warm_up(db: Session):
+    """Ejecuta una vez las consultas del escaneo (SQL compilado) y carga las fotos en memoria."""
+    auth.verify_qr_content(auth.sign_qr_content("0"))
+    db.query(models.Student).filter(models.Student.student_id == "").first()
+    db.query(models.ExitLog).filter(models.ExitLog.student_id == 0)\
+        .order_by(models.ExitLog.timestamp.desc()).first()
+    photo_paths = [p for (p,) in db.query(models.Student.photo_path).filter(models.Student.photo_path.isnot(None))]
+    return photos.warm_variant_index(photo_paths, PHOTO_PX)
+
+def _register_exit(db: Session, data: dict, user):
     raw_qr_code  = data.get("qr_code")
     door_id = data.get("door_id")
 
@@ -86,12 +106,11 @@ async def process_scan(request: Request, db: Session = Depends(database.get_db))
                 "student": {
                     "name": student.full_name,
                     "course": student.course,
-                    "photo": student.photo_path
+                    "photo": photos.variant_url(student.photo_path, PHOTO_PX)
                 }
             })
 
     # 4. Registrar Salida (Si pasó todas las validaciones)
-    user = request.state.user
     operator_id = user.id if user else 1
 
     # Validar que door_id sea número
@@ -116,6 +135,6 @@ async def process_scan(request: Request, db: Session = Depends(database.get_db))
         "student": {
             "name": student.full_name,
             "course": student.course,
-            "photo": student.photo_path
+            "photo": photos.variant_url(student.photo_path, PHOTO_PX)
         }
     })
\ No newline at end of file
@@ -1,17 +1,18 @@
 from fastapi import APIRouter, Depends, Form, UploadFile, File, HTTPException, Response, Query
 from fastapi.responses import RedirectResponse
-from fastapi.templating import Jinja2Templates
 from sqlalchemy.orm import Session
 from typing import List, Optional
-import pandas as pd
 import io
 import os
 import shutil
-import zipfile 
-from .. import database, models, schemas, deps
+import tempfile
+from .. import database, models, schemas, deps, photos, jobs, pagination
+from ..templating import templates
 from starlette.requests import Request
 import math
-from sqlalchemy import or_
+from types import SimpleNamespace
+import pytz
+from datetime import datetime
 
 router = APIRouter(
     prefix="/students",
@@ -19,19 +20,19 @@ router = APIRouter(
     dependencies=[Depends(deps.require_admin)]
 )
 
-templates = Jinja2Templates(directory="app/templates")
-PHOTOS_DIR = "app/static/photos"
-
-# Asegurar que el directorio existe
-os.makedirs(PHOTOS_DIR, exist_ok=True)
+PHOTOS_DIR = photos.PHOTOS_DIR
+TZ_COLOMBIA = pytz.timezone('America/Bogota')
 
 # --- VISTAS ---
 
 @router.get("/")
 def list_students(
     request: Request, 
-    page: int = Query(1, ge=1), # Página actual, defecto 1
+    page: int = Query(1, ge=1), # Número de página (solo para mostrar)
     q: str = Query(None),       # Término de búsqueda
+    after: int = Query(None),   # Cursor: id del último estudiante de la página anterior
+    before: int = Query(None),  # Cursor: id del primer estudiante de la página siguiente
+    last: bool = Query(False),  # Ir a la última página
     db: Session = Depends(database.get_db)
 ):
     LIMIT = 10 # Cantidad de estudiantes por página
@@ -39,46 +40,68 @@ def list_students(
     # Consulta base
     query = db.query(models.Student)
     
-    # Aplicar búsqueda si existe
+    # Aplicar búsqueda si existe (por Nombre o por ID, usando índices)
     if q:
-        search_fmt = f"%{q}%"
-        # Busca por Nombre O por ID
         query = query.filter(
-            or_(
-                models.Student.full_name.ilike(search_fmt),
-                models.Student.student_id.ilike(search_fmt)
-            )
+            pagination.search_filter(db, q, models.Student.full_name, models.Student.student_id)
         )
     
-    # Contar total de resultados (para saber cuántas páginas hay)
-    total_records = query.count()
+    # Contar total de resultados (en caché hasta que cambie la tabla)
+    total_records = pagination.cached_count("students", q or "", query)
     total_pages = math.ceil(total_records / LIMIT)
     
-    # Calcular offset
-    offset = (page - 1) * LIMIT
+    # Paginación por cursor sobre (created_at, id): los nuevos primero
+    students, nav = pagination.keyset_paginate(
+        db, query, models.Student.created_at, models.Student.id, LIMIT,
+        after=after, before=before, last=last, descending=True,
+        total=total_records
+    )
+    if last:
+        page = max(total_pages, 1)
+    elif not nav["has_prev"]:
+        page = 1
     
-    # Obtener registros de la página actual
-    # Ordenamos por creación descendente para ver los nuevos, o por nombre si prefieres
-    students = query.order_by(models.Student.created_at.desc()).offset(offset).limit(LIMIT).all()
+    # Datos para el formulario de cambios masivos (en caché junto al conteo)
+    courses = pagination.cached("students", "courses", lambda: [
+        c for (c,) in db.query(models.Student.course).distinct().order_by(models.Student.course)
+    ])
+    saved_filters = pagination.cached("student_filters", "all", lambda: [
+        SimpleNamespace(id=f.id, name=f.name, course=f.course, q=f.q)
+        for f in db.query(models.StudentFilter).order_by(models.StudentFilter.name)
+    ])
+    last_print_run = pagination.cached("card_print_runs", "students", lambda: _last_print_run(db, "students"))
     
     return templates.TemplateResponse("students.html", {
         "request": request, 
         "students": students, 
+        "courses": courses,
+        "saved_filters": saved_filters,
+        "last_print_run": last_print_run,
         "user": request.state.user,
         # Datos para paginación en el frontend
         "pagination": {
             "page": page,
             "total_pages": total_pages,
             "total_records": total_records,
-            "has_next": page < total_pages,
-            "has_prev": page > 1,
+            "has_next": nav["has_next"],
+            "has_prev": nav["has_prev"],
+            "first_id": nav["first_id"],
+            "last_id": nav["last_id"],
             "q": q or "" # Devolver el término de búsqueda para mantenerlo en el input
         }
     })
+
+def _last_print_run(db: Session, kind: str):
+    run = db.query(models.CardPrintRun).filter(models.CardPrintRun.kind == kind)\
+        .order_by(models.CardPrintRun.id.desc()).first()
+    if not run:
+        return None
+    return SimpleNamespace(created_at=run.created_at, card_count=run.card_count, filters=run.filters)
+
 # --- API / ACCIONES ---
 
 @router.post("/create")
-async def create_student(
+def create_student(
     student_id: str = Form(...),
     full_name: str = Form(...),
     course: str = Form(...),
@@ -107,6 +130,7 @@ async def create_student(
         
         # Ruta relativa para guardar en BD
         photo_path = f"/static/photos/{filename}"
+        photos.refresh_variants(photo_path)
 
     new_student = models.Student(
         student_id=student_id,
@@ -151,13 +175,121 @@ def toggle_auth(id: int, db: Session = Depends(database.get_db)):
     student = db.query(models.Student).filter(models.Student.id == id).first()
     if student:
         student.is_authorized = not student.is_authorized
+        student.auth_expires_at = None # Un cambio manual deja de ser temporal
         db.commit()
     return RedirectResponse(url="/students", status_code=303)
 
+# --- CAMBIOS MASIVOS ---
+
+def _selection_filter(db: Session, course: str = None, q: str = None, ids: List[str] = None):
+    """Condiciones SQL para un curso, una búsqueda y/o una lista de IDs."""
+    conditions = []
+    if course:
+        conditions.append(models.Student.course == course)
+    if q:
+        conditions.append(pagination.search_filter(db, q, models.Student.full_name, models.Student.student_id))
+    if ids is not None:
+        conditions.append(models.Student.student_id.in_(ids))
+    return conditions
+
+@router.post("/bulk")
+def bulk_update(
+    scope: str = Form(...),             # "course" | "ids" | "filter"
+    course: str = Form(None),
+    ids: str = Form(None),              # IDs separados por coma, espacio o salto de línea
+    filter_id: int = Form(None),
+    authorization: str = Form(""),      # "" (sin cambio) | "1" | "0"
+    expires_at: str = Form(None),       # Opcional (datetime-local): revertir la autorización a esta hora
+    lunch_plan: str = Form(""),         # "" (sin cambio) | Normal | Especial | Ninguno
+    db: Session = Depends(database.get_db)
+):
+    # 1. Selección
+    if scope == "course" and course:
+        conditions = _selection_filter(db, course=course.strip())
+    elif scope == "ids" and ids:
+        id_list = [i for i in ids.replace(",", " ").split() if i]
+        conditions = _selection_filter(db, ids=id_list)
+    elif scope == "filter" and filter_id:
+        saved = db.query(models.StudentFilter).filter(models.StudentFilter.id == filter_id).first()
+        if not saved:
+            return RedirectResponse(url="/students?error=Filtro+no+encontrado", status_code=303)
+        conditions = _selection_filter(db, course=saved.course, q=saved.q)
+    else:
+        return RedirectResponse(url="/students?error=Seleccion+invalida", status_code=303)
+
+    if not conditions:
+        return RedirectResponse(url="/students?error=El+filtro+no+tiene+condiciones", status_code=303)
+
+    # 2. Valores a cambiar
+    values = {}
+    if authorization in ("1", "0"):
+        values[models.Student.is_authorized] = authorization == "1"
+        values[models.Student.auth_expires_at] = None
+        if authorization == "1" and expires_at:
+            try:
+                values[models.Student.auth_expires_at] = datetime.strptime(expires_at, "%Y-%m-%dT%H:%M")
+            except ValueError:
+                return RedirectResponse(url="/students?error=Fecha+de+vencimiento+invalida", status_code=303)
+
+    if lunch_plan:
+        try:
+            plan = models.LunchType(lunch_plan)
+        except ValueError:
+            return RedirectResponse(url="/students?error=Tipo+de+almuerzo+invalido", status_code=303)
+        values[models.Student.has_lunch] = plan != models.LunchType.NONE
+        values[models.Student.lunch_type] = plan.value
+
+    if not values:
+        return RedirectResponse(url="/students?error=No+se+selecciono+ningun+cambio", status_code=303)
+
+    # 3. Un solo UPDATE para toda la selección
+    updated = db.query(models.Student).filter(*conditions).update(values, synchronize_session=False)
+    db.commit()
+    return RedirectResponse(url=f"/students?msg=Estudiantes+actualizados:+{updated}", status_code=303)
+
+@router.post("/filters/create")
+def create_filter(
+    name: str = Form(...),
+    course: str = Form(None),
+    q: str = Form(None),
+    db: Session = Depends(database.get_db)
+):
+    course = (course or "").strip() or None
+    q = (q or "").strip() or None
+    if not course and not q:
+        return RedirectResponse(url="/students?error=El+filtro+necesita+curso+o+busqueda", status_code=303)
+    if db.query(models.StudentFilter).filter(models.StudentFilter.name == name).first():
+        return RedirectResponse(url="/students?error=Ya+existe+un+filtro+con+ese+nombre", status_code=303)
+    db.add(models.StudentFilter(name=name, course=course, q=q))
+    db.commit()
+    return RedirectResponse(url="/students?msg=Filtro+guardado", status_code=303)
+
+@router.get("/filters/delete/{id}")
+def delete_filter(id: int, db: Session = Depends(database.get_db)):
+    saved = db.query(models.StudentFilter).filter(models.StudentFilter.id == id).first()
+    if saved:
+        db.delete(saved)
+        db.commit()
+    return RedirectResponse(url="/students?msg=Filtro+eliminado", status_code=303)
+
+def revert_expired_authorizations(db: Session):
+    """Quita las autorizaciones temporales vencidas (se ejecuta periódicamente)."""
+    now_co = datetime.now(TZ_COLOMBIA).replace(tzinfo=None)
+    reverted = db.query(models.Student).filter(
+        models.Student.auth_expires_at != None,
+        models.Student.auth_expires_at <= now_co
+    ).update({
+        models.Student.is_authorized: False,
+        models.Student.auth_expires_at: None
+    }, synchronize_session=False)
+    db.commit()
+    return reverted
+
 # --- IMPORTACIÓN EXCEL ---
 
 @router.get("/template")
 def download_template():
+    import pandas as pd  # Se importa aquí y no al cargar el módulo: arranque del worker más liviano
     df = pd.DataFrame(columns=["ID", "Nombre Completo", "Curso", "Autorizado (SI/NO)"])
     output = io.BytesIO()
     with pd.ExcelWriter(output, engine='openpyxl') as writer:
@@ -167,15 +299,25 @@ def download_template():
     return Response(content=output.getvalue(), headers=headers, media_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet')
 
 @router.post("/import")
-async def import_students(file: UploadFile = File(...), db: Session = Depends(database.get_db)):
+def import_students(request: Request, file: UploadFile = File(...)):
     if not file.filename.endswith(('.xls', '.xlsx')):
         return RedirectResponse(url="/students?error=Formato+invalido", status_code=303)
     
-    contents = await file.read()
+    xlsx_path = jobs.spool_upload(file, os.path.splitext(file.filename)[1])
+    job_id = jobs.submit("students.import", _import_students_job, xlsx_path,
+                         user=request.state.user, result_url="/students")
+    return RedirectResponse(url=f"/jobs/{job_id}", status_code=303)
+
+def _import_students_job(job, db: Session, xlsx_path: str):
+    import pandas as pd
     try:
-        df = pd.read_excel(io.BytesIO(contents))
-        count = 0
-        for _, row in df.iterrows():
+        df = pd.read_excel(xlsx_path)
+    finally:
+        os.remove(xlsx_path)
+    job.set_total(len(df))
+    count = 0
+    for i, row in df.iterrows():
+        try:
             sid = str(row[0]).strip()
             name = str(row[1]).strip()
             course = str(row[2]).strip()
@@ -191,127 +333,142 @@ async def import_students(file: UploadFile = File(...), db: Session = Depends(da
                 new_student = models.Student(student_id=sid, full_name=name, course=course, is_authorized=is_auth)
                 db.add(new_student)
             count += 1
-        
-        db.commit()
-        return RedirectResponse(url=f"/students?msg=Procesados+{count}+registros", status_code=303)
-    except Exception as e:
-        print(e)
-        return RedirectResponse(url="/students?error=Error+al+procesar+archivo", status_code=303)
+        except Exception as e:
+            job.error(f"Fila {i + 2}: {e}")
+        job.advance()
+    
+    db.commit()
+    job.finish(f"Procesados {count} registros", f"/students?msg=Procesados+{count}+registros")
 
 # --- IMPORTACIÓN MASIVA DE FOTOS (ZIP) ---
 
 @router.post("/import-photos")
-async def import_photos_zip(file: UploadFile = File(...), db: Session = Depends(database.get_db)):
+def import_photos_zip(request: Request, file: UploadFile = File(...)):
     if not file.filename.endswith('.zip'):
         return RedirectResponse(url="/students?error=Debe+ser+un+archivo+ZIP", status_code=303)
 
+    # Copiar el ZIP a un archivo propio: el de la petición se borra al responder
+    job_id = jobs.submit("students.import-photos", _import_photos_job, jobs.spool_upload(file, ".zip"),
+                         user=request.state.user, result_url="/students")
+    return RedirectResponse(url=f"/jobs/{job_id}", status_code=303)
+
+def _import_photos_job(job, db: Session, zip_path: str):
     try:
-        content = await file.read()
-        zip_buffer = io.BytesIO(content)
-        
-        processed_count = 0
-        
-        with zipfile.ZipFile(zip_buffer, 'r') as zip_ref:
-            # Obtener lista de archivos en el ZIP
-            for file_name in zip_ref.namelist():
-                # Ignorar carpetas o archivos ocultos (__MACOSX, etc)
-                if file_name.startswith("__") or file_name.endswith("/"):
-                    continue
-                
-                # Extraer nombre base (ID) y extensión
-                # Ejemplo: "fotos/1001.jpg" -> "1001.jpg"
-                base_name = os.path.basename(file_name) 
-                name_parts = os.path.splitext(base_name)
-                
-                if len(name_parts) < 2: continue
-                
-                student_id = name_parts[0] # El ID es el nombre del archivo
-                ext = name_parts[1].lower()
-                
-                if ext not in ['.jpg', '.jpeg', '.png']:
-                    continue
-                
-                # Buscar estudiante por ID
-                student = db.query(models.Student).filter(models.Student.student_id == student_id).first()
-                
-                if student:
-                    # Guardar archivo
-                    target_filename = f"{student_id}{ext}"
-                    target_path = os.path.join(PHOTOS_DIR, target_filename)
-                    
-                    with open(target_path, "wb") as f:
-                        f.write(zip_ref.read(file_name))
-                    
-                    # Actualizar BD
-                    student.photo_path = f"/static/photos/{target_filename}"
-                    processed_count += 1
-        
-        db.commit()
-        return RedirectResponse(url=f"/students?msg=Fotos+actualizadas:+{processed_count}", status_code=303)
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            # 1. Extraer fotos al disco, miembro a miembro
+            with open(zip_path, "rb") as f:
+                extracted = photos.extract_zip_photos(f, tmp_dir)
+            job.set_total(len(extracted))
+
+            # 2. Resolver todos los IDs con una sola consulta
+            rows = db.query(models.Student.id, models.Student.student_id)\
+                .filter(models.Student.student_id.in_(list(extracted))).all()
+            known = {sid for _, sid in rows}
+            for sid in extracted:
+                if sid not in known:
+                    job.error(f"{sid}: estudiante no encontrado")
+                    job.advance()
+
+            # 3. Normalizar en paralelo (EXIF, recorte y variantes)
+            def on_photo(sid, filename):
+                if not filename:
+                    job.error(f"{sid}: imagen inválida")
+                job.advance()
 
-    except Exception as e:
-        print(f"Error ZIP: {e}")
-        return RedirectResponse(url="/students?error=Error+al+procesar+ZIP", status_code=303)
+            results = photos.normalize_batch([(extracted[sid], sid) for _, sid in rows], progress=on_photo)
+    finally:
+        os.remove(zip_path)
+
+    # 4. Actualizar BD en bloque
+    mappings = [
+        {"id": pk, "photo_path": photos.photo_url(results[sid])}
+        for pk, sid in rows if results.get(sid)
+    ]
+    db.bulk_update_mappings(models.Student, mappings)
+    db.commit()
+    for mapping in mappings:
+        photos.forget_variants(mapping["photo_path"])
+    job.finish(f"Fotos actualizadas: {len(mappings)}", f"/students?msg=Fotos+actualizadas:+{len(mappings)}")
 
 # --- ACTUALIZACIONES ESPECÍFICAS (ALMUERZOS / RFID) ---
 
 @router.post("/update-lunch-groups")
-async def update_lunch_groups_students(file: UploadFile = File(...), db: Session = Depends(database.get_db)):
+def update_lunch_groups_students(request: Request, file: UploadFile = File(...)):
     """
     Excel: Col 0 -> Student ID, Col 1 -> Grupos (Texto)
     Busca 'ALMUERZO NORMAL' o 'ALMUERZO ESPECIAL'
     """
-    print("mola")
     if not file.filename.endswith(('.xls', '.xlsx')): 
         return RedirectResponse("/students?error=Formato+invalido", 303)
+    xlsx_path = jobs.spool_upload(file, os.path.splitext(file.filename)[1])
+    job_id = jobs.submit("students.update-lunch-groups", _update_lunch_groups_job, xlsx_path,
+                         user=request.state.user, result_url="/students")
+    return RedirectResponse(f"/jobs/{job_id}", 303)
+
+def _update_lunch_groups_job(job, db: Session, xlsx_path: str):
+    import pandas as pd
     try:
-        content = await file.read()
-        df = pd.read_excel(io.BytesIO(content))
-        updated = 0
-        
-        for _, row in df.iterrows():
-            sid = str(row[0]).strip()
-            # Asegurar que grupos no sea NaN
-            raw_groups = str(row[1]).upper() if pd.notna(row[1]) else ""
-            
-            student = db.query(models.Student).filter(models.Student.student_id == sid).first()
-            if student:
-                # Logica de asignación estricta según requerimiento
-                if "ALMUERZO NORMAL" in raw_groups:
-                    student.has_lunch = True
-                    student.lunch_type = models.LunchType.NORMAL
-                elif "ALMUERZO ESPECIAL" in raw_groups:
-                    student.has_lunch = True
-                    student.lunch_type = models.LunchType.ESPECIAL
-                else:
-                    # Si no está en el texto, se quita el permiso
-                    student.has_lunch = False
-                    student.lunch_type = models.LunchType.NONE
-                updated += 1
+        df = pd.read_excel(xlsx_path)
+    finally:
+        os.remove(xlsx_path)
+    job.set_total(len(df))
+    updated = 0
+    
+    for i, row in df.iterrows():
+        sid = str(row[0]).strip()
+        # Asegurar que grupos no sea NaN
+        raw_groups = str(row[1]).upper() if pd.notna(row[1]) else ""
         
-        db.commit()
-        return RedirectResponse(f"/students?msg=Almuerzos+actualizados:+{updated}", 303)
-    except Exception as e:
-        print(e)
-        return RedirectResponse("/students?error=Error+procesando+archivo", 303)
+        student = db.query(models.Student).filter(models.Student.student_id == sid).first()
+        if student:
+            # Logica de asignación estricta según requerimiento
+            if "ALMUERZO NORMAL" in raw_groups:
+                student.has_lunch = True
+                student.lunch_type = models.LunchType.NORMAL
+            elif "ALMUERZO ESPECIAL" in raw_groups:
+                student.has_lunch = True
+                student.lunch_type = models.LunchType.ESPECIAL
+            else:
+                # Si no está en el texto, se quita el permiso
+                student.has_lunch = False
+                student.lunch_type = models.LunchType.NONE
+            updated += 1
+        else:
+            job.error(f"Fila {i + 2}: estudiante {sid} no encontrado")
+        job.advance()
+    
+    db.commit()
+    job.finish(f"Almuerzos actualizados: {updated}", f"/students?msg=Almuerzos+actualizados:+{updated}")
 
 @router.post("/update-rfid")
-async def update_rfid_students(file: UploadFile = File(...), db: Session = Depends(database.get_db)):
+def update_rfid_students(request: Request, file: UploadFile = File(...)):
     """Excel: Col 0 -> Student ID, Col 1 -> RFID Code"""
     if not file.filename.endswith(('.xls', '.xlsx')): 
         return RedirectResponse("/students?error=Formato+invalido", 303)
+    xlsx_path = jobs.spool_upload(file, os.path.splitext(file.filename)[1])
+    job_id = jobs.submit("students.update-rfid", _update_rfid_job, xlsx_path,
+                         user=request.state.user, result_url="/students")
+    return RedirectResponse(f"/jobs/{job_id}", 303)
+
+def _update_rfid_job(job, db: Session, xlsx_path: str):
+    import pandas as pd
     try:
-        df = pd.read_excel(io.BytesIO(await file.read()))
-        updated = 0
-        for _, row in df.iterrows():
-            sid = str(row[0]).strip()
-            rfid = str(row[1]).strip()
-            if rfid.endswith('.0'): rfid = rfid[:-2]
+        df = pd.read_excel(xlsx_path)
+    finally:
+        os.remove(xlsx_path)
+    job.set_total(len(df))
+    updated = 0
+    for i, row in df.iterrows():
+        sid = str(row[0]).strip()
+        rfid = str(row[1]).strip()
+        if rfid.endswith('.0'): rfid = rfid[:-2]
 
-            student = db.query(models.Student).filter(models.Student.student_id == sid).first()
-            if student:
-                student.rfid_code = rfid
-                updated += 1
-        db.commit()
-        return RedirectResponse(f"/students?msg=RFIDs+actualizados:+{updated}", 303)
-    except Exception: return RedirectResponse("/students?error=Error+archivo", 303)
\ No newline at end of file
+        student = db.query(models.Student).filter(models.Student.student_id == sid).first()
+        if student:
+            student.rfid_code = rfid
+            updated += 1
+        else:
+            job.error(f"Fila {i + 2}: estudiante {sid} no encontrado")
+        job.advance()
+    db.commit()
+    job.finish(f"RFIDs actualizados: {updated}", f"/students?msg=RFIDs+actualizados:+{updated}")
@@ -0,0 +1,33 @@
+from fastapi import APIRouter, Depends, Request
+from .. import database, deps, lanes, sqltrace
+from ..templating import templates
+
+router = APIRouter(
+    prefix="/system",
+    tags=["System"],
+    dependencies=[Depends(deps.require_admin)]
+)
+
+
+def _metrics() -> dict:
+    return {
+        "pools": {
+            "principal": database.pool_stats(database.engine),
+            "escaneo": database.pool_stats(database.scan_engine),
+            "pesado": database.pool_stats(database.bulk_engine),
+        },
+        "lanes": lanes.lane_stats(),
+        "endpoints": sqltrace.endpoint_stats(),
+    }
+
+@router.get("/metrics")
+def metrics_view(request: Request):
+    return templates.TemplateResponse("system.html", {
+        "request": request,
+        "user": request.state.user,
+        "metrics": _metrics(),
+    })
+
+@router.get("/metrics.json")
+def metrics_json():
+    return _metrics()
@@ -1,9 +1,9 @@
 from fastapi import APIRouter, Depends, Form, HTTPException
 from fastapi.responses import RedirectResponse
-from fastapi.templating import Jinja2Templates
 from sqlalchemy.orm import Session
 from starlette.requests import Request
 from .. import database, models, deps, auth
+from ..templating import templates
 
 router = APIRouter(
     prefix="/users",
@@ -11,7 +11,6 @@ router = APIRouter(
     dependencies=[Depends(deps.require_admin)] # ¡Solo Admins pueden entrar aquí!
 )
 
-templates = Jinja2Templates(directory="app/templates")
 
 @router.get("/")
 def list_users(request: Request, db: Session = Depends(database.get_db)):
@@ -66,6 +65,7 @@ def update_user(
         user.hashed_password = auth.get_password_hash(password)
         
     db.commit()
+    deps.invalidate_user(user_id)
     return RedirectResponse(url="/users?msg=Usuario+actualizado", status_code=303)
 
 @router.get("/delete/{user_id}")
@@ -78,4 +78,5 @@ def delete_user(user_id: int, request: Request, db: Session = Depends(database.g
     if user:
         db.delete(user)
         db.commit()
+        deps.invalidate_user(user_id)
     return RedirectResponse(url="/users?msg=Usuario+eliminado", status_code=303)
\ No newline at end of file
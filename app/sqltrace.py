@@ -0,0 +1,155 @@
+"""
+Instrumentación SQL por petición.
+Eventos de SQLAlchemy cuentan las consultas y el tiempo en la base de datos de
+cada petición (contextvar: también funciona dentro de los hilos y carriles).
+La respuesta lleva el encabezado Server-Timing (visible en las DevTools del
+navegador) y se registra un aviso (logger "school_guard.sql", nivel WARNING)
+cuando un endpoint pasa el presupuesto de consultas o repite la misma
+sentencia muchas veces (N+1: relaciones lazy en un ciclo).
+Viene apagado: se activa con SQL_TRACE=true al investigar un endpoint lento.
+"""
+import os
+import time
+import logging
+import threading
+from collections import Counter
+from contextvars import ContextVar
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from starlette.datastructures import MutableHeaders
+
+# --- CONFIGURACIÓN ---
+SQL_TRACE = os.getenv("SQL_TRACE", "false").lower() in ("1", "true", "yes")
+SQL_QUERY_BUDGET = int(os.getenv("SQL_QUERY_BUDGET", "25"))          # Consultas por petición
+SQL_REPEAT_THRESHOLD = int(os.getenv("SQL_REPEAT_THRESHOLD", "10"))  # Misma sentencia N veces = N+1
+SQL_WARN_INTERVAL = 60   # Segundos mínimos entre avisos del mismo endpoint
+IGNORED_PREFIXES = ("/static", "/healthz", "/readyz")
+UNMATCHED_LABEL = "<404>"  # Rutas inexistentes: una sola entrada, no una por URL
+
+logger = logging.getLogger("school_guard.sql")
+
+
+class RequestStats:
+    """Consultas de una petición."""
+
+    __slots__ = ("count", "seconds", "statements")
+
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+        self.statements = Counter()
+
+    def record(self, statement: str, seconds: float):
+        self.count += 1
+        self.seconds += seconds
+        self.statements[statement] += 1
+
+    def most_repeated(self):
+        """(sentencia, veces) de la consulta más repetida, o None."""
+        if not self.statements:
+            return None
+        return self.statements.most_common(1)[0]
+
+    def server_timing(self) -> str:
+        return f'db;dur={self.seconds * 1000:.1f};desc="SQL x{self.count}"'
+
+
+_current: ContextVar = ContextVar("sql_request_stats", default=None)
+
+# Acumulado por endpoint ("GET /ruta") desde el inicio del worker
+_endpoints = {}
+_endpoints_lock = threading.Lock()
+_last_warning = {}   # endpoint -> momento del último aviso
+
+
+@event.listens_for(Engine, "before_cursor_execute")
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if _current.get() is not None:
+        context._sqltrace_start = time.perf_counter()
+
+
+@event.listens_for(Engine, "after_cursor_execute")
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    stats = _current.get()
+    start = getattr(context, "_sqltrace_start", None)
+    if stats is not None and start is not None:
+        stats.record(statement, time.perf_counter() - start)
+
+
+def _should_warn(label: str) -> bool:
+    now = time.monotonic()
+    with _endpoints_lock:
+        if now - _last_warning.get(label, float("-inf")) < SQL_WARN_INTERVAL:
+            return False
+        _last_warning[label] = now
+    return True
+
+def _finish(scope, stats: RequestStats):
+    route = scope.get("route")
+    # Solo rutas declaradas: las URL inexistentes (escaneos de bots) irían creciendo sin límite
+    label = f"{scope['method']} {route.path}" if route else UNMATCHED_LABEL
+    repeated = stats.most_repeated()
+    n_plus_one = repeated is not None and repeated[1] >= SQL_REPEAT_THRESHOLD
+    over_budget = stats.count > SQL_QUERY_BUDGET
+
+    if (over_budget or n_plus_one) and _should_warn(label):
+        if over_budget:
+            logger.warning("%s: %d consultas (presupuesto %d), %.0f ms en BD",
+                           label, stats.count, SQL_QUERY_BUDGET, stats.seconds * 1000)
+        if n_plus_one:
+            statement = " ".join(repeated[0].split())[:160]
+            logger.warning("Posible N+1 en %s: la misma consulta %d veces: %s", label, repeated[1], statement)
+
+    with _endpoints_lock:
+        entry = _endpoints.setdefault(label, {
+            "requests": 0, "queries": 0, "max_queries": 0, "db_ms": 0.0, "warnings": 0,
+        })
+        entry["requests"] += 1
+        entry["queries"] += stats.count
+        entry["max_queries"] = max(entry["max_queries"], stats.count)
+        entry["db_ms"] += stats.seconds * 1000
+        entry["warnings"] += int(over_budget or n_plus_one)
+
+
+def endpoint_stats(limit: int = 20):
+    """Endpoints con más consultas por petición (promedio)."""
+    with _endpoints_lock:
+        rows = [
+            {
+                "endpoint": label,
+                "requests": e["requests"],
+                "avg_queries": round(e["queries"] / e["requests"], 1),
+                "max_queries": e["max_queries"],
+                "avg_db_ms": round(e["db_ms"] / e["requests"], 1),
+                "warnings": e["warnings"],
+            }
+            for label, e in _endpoints.items()
+        ]
+    rows.sort(key=lambda r: r["avg_queries"], reverse=True)
+    return rows[:limit]
+
+
+class SQLTraceMiddleware:
+    """Middleware ASGI: abre las estadísticas de la petición y agrega Server-Timing."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if not SQL_TRACE or scope["type"] != "http" or scope["path"].startswith(IGNORED_PREFIXES):
+            await self.app(scope, receive, send)
+            return
+
+        stats = RequestStats()
+        token = _current.set(stats)
+
+        async def send_with_timing(message):
+            if message["type"] == "http.response.start":
+                MutableHeaders(scope=message).append("Server-Timing", stats.server_timing())
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            _current.reset(token)
+            _finish(scope, stats)
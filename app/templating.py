@@ -0,0 +1,33 @@
+"""
+Entorno Jinja2 compartido por todos los routers.
+Un solo entorno = una sola caché de plantillas (base.html se compila una vez),
+con caché de bytecode en disco para que un worker nuevo no recompile nada.
+"""
+import os
+import jinja2
+from fastapi.templating import Jinja2Templates
+
+# --- CONFIGURACIÓN ---
+TEMPLATES_DIR = "app/templates"
+TEMPLATE_CACHE_DIR = os.getenv("TEMPLATE_CACHE_DIR", "cache/jinja")
+# En producción se puede desactivar: no revisa la fecha de cada plantilla en cada render
+TEMPLATE_AUTO_RELOAD = os.getenv("TEMPLATE_AUTO_RELOAD", "true").lower() in ("1", "true", "yes")
+
+os.makedirs(TEMPLATE_CACHE_DIR, exist_ok=True)
+
+env = jinja2.Environment(
+    loader=jinja2.FileSystemLoader(TEMPLATES_DIR),
+    autoescape=True,
+    auto_reload=TEMPLATE_AUTO_RELOAD,
+    cache_size=-1,  # Sin límite: son pocas plantillas y todas se precargan
+    bytecode_cache=jinja2.FileSystemBytecodeCache(TEMPLATE_CACHE_DIR),
+)
+
+templates = Jinja2Templates(env=env)
+
+def preload() -> int:
+    """Compila (o carga desde la caché de bytecode) todas las plantillas. Devuelve cuántas."""
+    names = env.list_templates(extensions=["html"])
+    for name in names:
+        env.get_template(name)
+    return len(names)
@@ -0,0 +1,98 @@
+"""
+Calentamiento del worker al arrancar.
+Antes de recibir escaneos se verifica que el esquema esté migrado, se abren y
+validan las conexiones, se configuran los
+mappers del ORM, se compilan las plantillas y se cargan las cachés del escáner.
+/readyz responde 200 solo cuando terminó, así el balanceador no le manda
+un escaneo de portería a un worker en frío.
+"""
+import os
+import time
+import threading
+import traceback
+from sqlalchemy import text
+from sqlalchemy.orm import configure_mappers
+from . import database, templating, migrations
+from .routers import scan, lunch
+
+# --- CONFIGURACIÓN ---
+# Conexiones a abrir en el pool principal; el de escaneo se llena completo
+# (es el que no puede esperar) y el pesado solo se valida con una.
+WARMUP_CONNECTIONS = int(os.getenv("WARMUP_CONNECTIONS", "2"))
+WARMUP_RETRY_SECONDS = 5     # Si la BD no responde se reintenta sin marcar el worker como listo
+
+state = {
+    "ready": False,
+    "started_at": None,
+    "seconds": None,
+    "steps": {},       # paso -> milisegundos
+    "error": None,
+}
+
+
+def warm_pool(engine, count: int) -> int:
+    """Abre `count` conexiones a la vez, las valida y las deja libres en el pool."""
+    conns = []
+    try:
+        for _ in range(count):
+            conn = engine.connect()
+            conn.execute(text("SELECT 1"))
+            conns.append(conn)
+    finally:
+        for conn in conns:
+            conn.close()
+    return len(conns)
+
+
+def _check_schema():
+    # Un worker con el esquema desactualizado no debe recibir tráfico
+    missing = migrations.pending(database.engine)
+    if missing:
+        raise RuntimeError(f"Migraciones pendientes: {', '.join(f'{v:04d}' for v, _ in missing)} (ejecute python migrate.py)")
+
+
+def _warm_scanners():
+    db = database.ScanSessionLocal()
+    try:
+        scan.warm_up(db)
+        lunch.warm_up(db)
+    finally:
+        db.close()
+
+
+def _step(name: str, fn, *args):
+    start = time.perf_counter()
+    fn(*args)
+    state["steps"][name] = round((time.perf_counter() - start) * 1000, 1)
+
+
+def run():
+    """Ejecuta todos los pasos; reintenta hasta que la base de datos responda."""
+    state["started_at"] = time.time()
+    pools = {
+        "principal": (database.engine, WARMUP_CONNECTIONS),
+        "escaneo": (database.scan_engine, database.scan_engine.pool.size()),
+        "pesado": (database.bulk_engine, 1),
+    }
+    while True:
+        try:
+            _step("esquema", _check_schema)
+            _step("mappers", configure_mappers)
+            _step("plantillas", templating.preload)
+            for name, (engine, count) in pools.items():
+                _step(f"pool_{name}", warm_pool, engine, count)
+            _step("escaner", _warm_scanners)
+            break
+        except Exception as e:
+            traceback.print_exc()
+            state["error"] = str(e)
+            time.sleep(WARMUP_RETRY_SECONDS)
+
+    state["error"] = None
+    state["seconds"] = round(time.time() - state["started_at"], 2)
+    state["ready"] = True
+
+
+def start():
+    """Lanza el calentamiento en un hilo: /healthz responde mientras tanto."""
+    threading.Thread(target=run, daemon=True, name="warmup").start()
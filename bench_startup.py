@@ -0,0 +1,69 @@
+"""
+Mide el arranque de un worker: tiempo de importar app.main y memoria residente (RSS).
+Cada medición corre en un proceso nuevo, como un worker de uvicorn recién lanzado.
+
+Uso:
+    python bench_startup.py              # 5 corridas
+    python bench_startup.py --runs 10
+"""
+import os
+import sys
+import json
+import argparse
+import statistics
+import subprocess
+import tempfile
+
+# Librerías pesadas que solo deberían cargarse en importaciones, exportaciones y carnets
+HEAVY_MODULES = ["pandas", "openpyxl", "reportlab", "qrcode", "PIL", "pypdf"]
+
+CHILD = """
+import json, sys, time
+start = time.perf_counter()
+import app.main
+elapsed = time.perf_counter() - start
+rss_kb = 0
+with open("/proc/self/status") as f:
+    for line in f:
+        if line.startswith("VmRSS:"):
+            rss_kb = int(line.split()[1])
+heavy = sorted({name.split(".")[0] for name in sys.modules} & set(%r))
+print(json.dumps({"seconds": elapsed, "rss_kb": rss_kb, "heavy": heavy}))
+""" % (HEAVY_MODULES,)
+
+
+def measure_once(env: dict) -> dict:
+    out = subprocess.run(
+        [sys.executable, "-c", CHILD],
+        env=env, capture_output=True, text=True, check=True,
+        cwd=os.path.dirname(os.path.abspath(__file__)),
+    )
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Tiempo de importación y RSS por worker")
+    parser.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args()
+
+    env = dict(os.environ)
+    # Valores mínimos para poder importar la app sin un .env de producción
+    tmp_db = os.path.join(tempfile.gettempdir(), "school_guard_bench.db")
+    env.setdefault("DATABASE_URL", f"sqlite:///{tmp_db}")
+    env.setdefault("SECRET_KEY", "bench")
+    env.setdefault("ALGORITHM", "HS256")
+    env.setdefault("ACCESS_TOKEN_EXPIRE_MINUTES", "120")
+
+    measure_once(env)  # Calentar la caché de disco y los .pyc
+    results = [measure_once(env) for _ in range(args.runs)]
+
+    seconds = [r["seconds"] * 1000 for r in results]
+    rss = [r["rss_kb"] / 1024 for r in results]
+    print(f"Corridas:            {args.runs}")
+    print(f"Importar app.main:   {statistics.median(seconds):.0f} ms (mín {min(seconds):.0f}, máx {max(seconds):.0f})")
+    print(f"RSS del worker:      {statistics.median(rss):.1f} MB")
+    print(f"Librerías pesadas:   {', '.join(results[-1]['heavy']) or 'ninguna'}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,9 +1,10 @@
 from app.database import SessionLocal, engine
-from app.models import Base, User, UserRole
+from app.models import User, UserRole
 from app.auth import get_password_hash
+from app import migrations
 
-# Asegurar que las tablas existen
-Base.metadata.create_all(bind=engine)
+# Crear/actualizar las tablas (mismas migraciones que migrate.py)
+migrations.upgrade(engine)
 
 def create_admin():
     db = SessionLocal()
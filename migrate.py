@@ -0,0 +1,30 @@
+"""
+Aplica las migraciones pendientes del esquema (app/migrations).
+Ejecutar una vez por despliegue, ANTES de reiniciar los workers.
+
+Uso:
+    python migrate.py            # Aplicar pendientes
+    python migrate.py --status   # Ver versiones aplicadas y pendientes
+"""
+import sys
+from app.database import engine
+from app import migrations
+
+
+def main():
+    if "--status" in sys.argv:
+        for version, name, description, applied in migrations.status(engine):
+            mark = "aplicada " if applied else "PENDIENTE"
+            print(f"[{mark}] {version:04d} {name} - {description}")
+        return
+
+    print("Aplicando migraciones...")
+    applied = migrations.upgrade(engine)
+    if applied:
+        print(f"Listo: {len(applied)} migraciones aplicadas.")
+    else:
+        print("El esquema ya está al día.")
+
+
+if __name__ == "__main__":
+    main()